@@ -1,111 +1,248 @@
 import streamlit as st
 import sqlite3
 import os
+import threading
+import logging
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
 import io
 from PIL import Image
 
+logger = logging.getLogger(__name__)
+
+DB_PATH = "gallery.db"
+PAGE_SIZE = 8192
+THUMB_SIZE = (400, 400)
+
+# Hot-path SQL kept as fixed strings so sqlite3's per-connection statement
+# cache (keyed on the SQL text) reuses the compiled VDBE programs
+STMTS = {
+    "image_keys": "SELECT name, folder FROM images",
+    "insert_image": "INSERT OR IGNORE INTO images (name, folder, image_data, thumb) VALUES (?, ?, ?, ?)",
+    "folder_images": "SELECT name, COALESCE(thumb, image_data) FROM images WHERE folder = ?",
+    "select_surveys": ("SELECT folder, rating, feedback, timestamp FROM surveys "
+                       "WHERE folder IN ({placeholders}) ORDER BY folder, timestamp"),
+    "insert_survey": "INSERT INTO surveys (folder, rating, feedback, timestamp) VALUES (?, ?, ?, ?)",
+    "delete_survey": "DELETE FROM surveys WHERE folder = ? AND timestamp = ?",
+}
+
+# -------------------------------
+# Database Connection
+# -------------------------------
+@st.cache_resource
+def get_conn():
+    # One long-lived connection shared across reruns and sessions; autocommit mode,
+    # so multi-statement writes issue their own BEGIN/COMMIT
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None, cached_statements=256)
+    # Per-connection tuning: fewer fsyncs, in-memory temp tables, 64MB page cache
+    # (8000 pages at PAGE_SIZE)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+    conn.execute("PRAGMA busy_timeout=5000")
+    # Serve BLOB pages straight from a 256MB memory map rather than read() syscalls
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+@st.cache_resource
+def get_write_lock():
+    # Serializes writers on the shared connection; readers never take it
+    return threading.Lock()
+
+@contextmanager
+def tx(write=False):
+    # Reads run straight on the autocommit connection with no lock and no commit;
+    # writes hold the writer lock inside one BEGIN/COMMIT (rolled back on error)
+    c = get_conn().cursor()
+    if not write:
+        yield c
+        return
+    with get_write_lock():
+        c.execute("BEGIN")
+        try:
+            yield c
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        c.execute("COMMIT")
+
+# -------------------------------
+# Survey timestamps (epoch microseconds)
+# -------------------------------
+def to_epoch_us(dt):
+    return int(dt.timestamp() * 1_000_000)
+
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts / 1_000_000).isoformat()
+
 # -------------------------------
 # Database Setup
 # -------------------------------
 def init_db():
-    conn = sqlite3.connect("gallery.db")
-    c = conn.cursor()
-    # Create images table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS images (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            folder TEXT NOT NULL,
-            image_data BLOB NOT NULL
-        )
-    """)
-    # Create surveys table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS surveys (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            folder TEXT NOT NULL,
-            rating INTEGER NOT NULL,
-            feedback TEXT,
-            timestamp TEXT NOT NULL
-        )
-    """)
-    conn.commit()
-    conn.close()
+    conn = get_conn()
+    with get_write_lock():
+        # 8KB pages suit the BLOB-heavy images table. page_size only takes effect on a
+        # fresh database or via VACUUM, and never while in WAL mode, so settle it first
+        if conn.execute("PRAGMA page_size").fetchone()[0] != PAGE_SIZE:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute(f"PRAGMA page_size={PAGE_SIZE}")
+            conn.execute("VACUUM")
+        # WAL is persistent in the database header, so it only needs to be set once
+        conn.execute("PRAGMA journal_mode=WAL")
+    with tx(write=True) as c:
+        # Create images table
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                image_data BLOB NOT NULL,
+                thumb BLOB
+            )
+        """)
+        # Databases created before thumbnails existed get the column added in place
+        if "thumb" not in {row[1] for row in c.execute("PRAGMA table_info(images)")}:
+            c.execute("ALTER TABLE images ADD COLUMN thumb BLOB")
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_images_name_folder ON images(name, folder)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_images_folder ON images(folder)")
+        # Create surveys table
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS surveys (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                folder TEXT NOT NULL,
+                rating INTEGER NOT NULL,
+                feedback TEXT,
+                timestamp INTEGER NOT NULL
+            )
+        """)
+        # Older databases stored ISO-8601 strings; rewrite them as epoch microseconds
+        if {row[1]: row[2] for row in c.execute("PRAGMA table_info(surveys)")}["timestamp"] == "TEXT":
+            c.execute("ALTER TABLE surveys RENAME TO surveys_old")
+            c.execute("""
+                CREATE TABLE surveys (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    folder TEXT NOT NULL,
+                    rating INTEGER NOT NULL,
+                    feedback TEXT,
+                    timestamp INTEGER NOT NULL
+                )
+            """)
+            c.executemany(
+                "INSERT INTO surveys (id, folder, rating, feedback, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [(row_id, folder, rating, feedback, to_epoch_us(datetime.fromisoformat(timestamp)))
+                 for row_id, folder, rating, feedback, timestamp
+                 in c.execute("SELECT id, folder, rating, feedback, timestamp FROM surveys_old").fetchall()]
+            )
+            c.execute("DROP TABLE surveys_old")
+        # Serves both the per-folder listing and delete_survey_entry's (folder, timestamp) lookup
+        c.execute("CREATE INDEX IF NOT EXISTS idx_surveys_folder_ts ON surveys(folder, timestamp)")
+
+# -------------------------------
+# Thumbnail generation
+# -------------------------------
+def make_thumbnail(image_data):
+    # Pre-sized JPEG rendered into the gallery instead of the full original
+    im = Image.open(io.BytesIO(image_data))
+    im.thumbnail(THUMB_SIZE)
+    buf = io.BytesIO()
+    im.convert("RGB").save(buf, "JPEG", quality=82)
+    return buf.getvalue()
 
 # -------------------------------
 # Load images into database from folders
 # -------------------------------
 def load_images_to_db(folders):
-    conn = sqlite3.connect("gallery.db")
-    c = conn.cursor()
+    # One up-front scan instead of a SELECT COUNT(*) probe per file
+    with tx() as c:
+        c.execute(STMTS["image_keys"])
+        existing = set(c.fetchall())
+
+    # Read and thumbnail every file before taking the write lock, so the disk scan and
+    # decodes never hold the transaction open and one bad file can't roll back the rest
+    rows = []
     for folder in folders:
         folder_path = folder
         if os.path.exists(folder_path):
             for image_file in os.listdir(folder_path):
-                if image_file.lower().endswith(('.jpg', '.jpeg', '.png')):
+                if image_file.lower().endswith(('.jpg', '.jpeg', '.png')) and (image_file, folder) not in existing:
                     image_path = os.path.join(folder_path, image_file)
-                    with open(image_path, 'rb') as f:
-                        image_data = f.read()
-                    # Check if image already exists to avoid duplicates
-                    c.execute("SELECT COUNT(*) FROM images WHERE name = ? AND folder = ?", (image_file, folder))
-                    if c.fetchone()[0] == 0:
-                        c.execute("INSERT INTO images (name, folder, image_data) VALUES (?, ?, ?)",
-                                  (image_file, folder, image_data))
-    conn.commit()
-    conn.close()
+                    try:
+                        with open(image_path, 'rb') as f:
+                            image_data = f.read()
+                        thumb = make_thumbnail(image_data)
+                    except Exception:
+                        logger.warning("Skipping unreadable image %s", image_path, exc_info=True)
+                        continue
+                    rows.append((image_file, folder, image_data, thumb))
+    if not rows:
+        return
+
+    with tx(write=True) as c:
+        # The UNIQUE(name, folder) index makes this safe against a concurrent ingest
+        c.executemany(STMTS["insert_image"], rows)
+        inserted = c.rowcount
+    if inserted > 0:
+        get_images_from_db.clear()
+
+# -------------------------------
+# Re-scan folders only when their contents change
+# -------------------------------
+def folder_mtimes(folders):
+    # A directory's mtime moves whenever an entry is added, removed or renamed
+    return tuple((folder, os.stat(folder).st_mtime_ns if os.path.exists(folder) else None)
+                 for folder in folders)
+
+@st.cache_resource(max_entries=1)
+def sync_folders(mtimes):
+    load_images_to_db([folder for folder, _ in mtimes])
+    return True
 
 # -------------------------------
 # Load survey data from database
 # -------------------------------
-def load_survey_data():
-    conn = sqlite3.connect("gallery.db")
-    c = conn.cursor()
-    c.execute("SELECT folder, rating, feedback, timestamp FROM surveys")
-    survey_data = {}
-    for row in c.fetchall():
-        folder, rating, feedback, timestamp = row
-        if folder not in survey_data:
-            survey_data[folder] = []
-        survey_data[folder].append({"rating": rating, "feedback": feedback, "timestamp": timestamp})
-    conn.close()
-    return survey_data
+@st.cache_data(ttl=60)
+def load_survey_data(folders):
+    # Only the folders being rendered; rows come back grouped by folder
+    if not folders:
+        return {}
+    placeholders = ",".join("?" * len(folders))
+    with tx() as c:
+        c.execute(STMTS["select_surveys"].format(placeholders=placeholders), folders)
+        rows = c.fetchall()
+    return {
+        folder: [{"rating": rating, "feedback": feedback, "timestamp": timestamp}
+                 for _, rating, feedback, timestamp in entries]
+        for folder, entries in groupby(rows, key=itemgetter(0))
+    }
 
 # -------------------------------
 # Save survey data to database
 # -------------------------------
 def save_survey_data(folder, rating, feedback, timestamp):
-    conn = sqlite3.connect("gallery.db")
-    c = conn.cursor()
-    c.execute("INSERT INTO surveys (folder, rating, feedback, timestamp) VALUES (?, ?, ?, ?)",
-              (folder, rating, feedback, timestamp))
-    conn.commit()
-    conn.close()
+    with tx(write=True) as c:
+        c.execute(STMTS["insert_survey"], (folder, rating, feedback, timestamp))
+    load_survey_data.clear()
 
 # -------------------------------
 # Delete survey entry from database
 # -------------------------------
 def delete_survey_entry(folder, timestamp):
-    conn = sqlite3.connect("gallery.db")
-    c = conn.cursor()
-    c.execute("DELETE FROM surveys WHERE folder = ? AND timestamp = ?", (folder, timestamp))
-    conn.commit()
-    conn.close()
+    with tx(write=True) as c:
+        c.execute(STMTS["delete_survey"], (folder, timestamp))
+    load_survey_data.clear()
 
 # -------------------------------
 # Get images from database
 # -------------------------------
+@st.cache_data(show_spinner=False)
 def get_images_from_db(folder):
-    conn = sqlite3.connect("gallery.db")
-    c = conn.cursor()
-    c.execute("SELECT name, image_data FROM images WHERE folder = ?", (folder,))
-    images = []
-    for row in c.fetchall():
-        name, image_data = row
-        image = Image.open(io.BytesIO(image_data))
-        images.append((name, image))
-    conn.close()
-    return images
+    # Stored thumbnail bytes (or the original for rows ingested before thumbnails
+    # existed) go straight to st.image without a server-side decode/re-encode
+    with tx() as c:
+        c.execute(STMTS["folder_images"], (folder,))
+        return c.fetchall()
 
 # -------------------------------
 # Data for the two test folders
@@ -114,12 +251,20 @@ data = [
     {"name": "Sarika", "age": 28, "profession": "Photographer", "category": "Artists", "folder": "sarika"},
     {"name": "Jamuna", "age": 32, "profession": "Sculptor", "category": "Artists", "folder": "jamuna"},
 ]
+CATEGORIES = sorted({item["category"] for item in data})
+BY_CATEGORY = {category: [item for item in data if item["category"] == category] for category in CATEGORIES}
 
 # -------------------------------
 # Initialize database and load images
 # -------------------------------
-init_db()
-load_images_to_db([item["folder"] for item in data])
+@st.cache_resource
+def _startup():
+    # Schema/PRAGMA setup runs once per process, not on every rerun
+    init_db()
+    return True
+
+_startup()
+sync_folders(folder_mtimes([item["folder"] for item in data]))
 
 # -------------------------------
 # CSS Styling + Prevent Right-Click
@@ -151,28 +296,25 @@ st.markdown("""
 # -------------------------------
 st.title("📸 Photo Gallery & Survey")
 
-survey_data = load_survey_data()
-categories = sorted(set(item["category"] for item in data))
-tabs = st.tabs(categories)
+survey_data = load_survey_data(tuple(item["folder"] for item in data))
 
 # -------------------------------
 # Loop through categories
 # -------------------------------
-for category, tab in zip(categories, tabs):
+for category, tab in zip(CATEGORIES, st.tabs(CATEGORIES)):
     with tab:
         st.header(category)
-        category_data = [item for item in data if item["category"] == category]
 
-        for item in category_data:
+        for item in BY_CATEGORY[category]:
             st.subheader(f"{item['name']} ({item['age']}, {item['profession']})")
 
             images = get_images_from_db(item["folder"])
             if images:
                 cols = st.columns(3)  # Show 3 images per row
-                for idx, (image_name, image) in enumerate(images):
+                for idx, (image_name, image_bytes) in enumerate(images):
                     with cols[idx % 3]:
                         st.markdown('<div class="image-container">', unsafe_allow_html=True)
-                        st.image(image, use_container_width=True)
+                        st.image(image_bytes, use_container_width=True)
                         st.markdown('</div>', unsafe_allow_html=True)
             else:
                 st.warning(f"No images found for {item['folder']}")
@@ -185,7 +327,7 @@ for category, tab in zip(categories, tabs):
                     rating = st.slider("Rating (1-5)", 1, 5, 3, key=f"rating_{item['folder']}")
                     feedback = st.text_area("Feedback", key=f"feedback_{item['folder']}")
                     if st.form_submit_button("Submit"):
-                        timestamp = datetime.now().isoformat()
+                        timestamp = to_epoch_us(datetime.now())
                         save_survey_data(item["folder"], rating, feedback, timestamp)
                         st.success("✅ Response recorded")
                         st.rerun()
@@ -196,10 +338,12 @@ for category, tab in zip(categories, tabs):
             if item["folder"] in survey_data and survey_data[item["folder"]]:
                 st.subheader(f"💬 Survey Responses for {item['name']}")
                 for entry in survey_data[item["folder"]]:
-                    with st.expander(f"{entry['timestamp']}"):
+                    with st.expander(format_timestamp(entry["timestamp"])):
                         st.write(f"⭐ {entry['rating']} — {entry['feedback']}")
-                        if st.button("🗑️ Delete", key=f"delete_{item['folder']}_{entry['timestamp']}"):
-                            delete_survey_entry(item["folder"], entry["timestamp"])
-                            st.rerun()
+                        # Delete control lives in its own form, like the survey form above
+                        with st.form(key=f"delete_{item['folder']}_{entry['timestamp']}"):
+                            if st.form_submit_button("🗑️ Delete"):
+                                delete_survey_entry(item["folder"], entry["timestamp"])
+                                st.rerun()
             else:
                 st.caption("No survey responses yet.")
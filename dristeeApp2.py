@@ -1,95 +1,267 @@
 import streamlit as st
 import sqlite3
 import io
+import html
+import logging
+import PIL
 from PIL import Image
 import os
 from datetime import datetime
 import uuid
+import threading
 import re
-import base64
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Load environment variables for secure password
 load_dotenv()
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")  # Fallback for testing
 
 DB_PATH = "gallery.db"
+MEDIA_DIR = "media"  # Full-size images live on disk as media/<folder>/<name>
+SURVEY_PAGE_SIZE = 50  # Comments shown per folder expander
+ZOOM_MAX_SIZE = (1600, 1600)  # Largest image the zoom view sends to the browser
+
+# Seed rows for the folders table: (folder, name, age, profession, category)
+DEFAULT_FOLDERS = [
+    ("sarika", "Sarika", 28, "Photographer", "Artists"),
+    ("jamuna", "Jamuna", 32, "Sculptor", "Artists"),
+]
 
 # -------------------------------
 # Helper Functions
 # -------------------------------
-def image_to_base64(image_data):
-    """Convert image data (bytes) to base64 string."""
-    return base64.b64encode(image_data).decode('utf-8') if isinstance(image_data, bytes) else image_data.encode('utf-8')
-
-def generate_thumbnail(image, size=(100, 100)):
-    """Generate a thumbnail for an image."""
-    img = image.copy()
-    img.thumbnail(size)
+def generate_thumbnail(image_data, size=(100, 100)):
+    """Generate a thumbnail from raw image bytes without a full-resolution decode."""
+    img = Image.open(io.BytesIO(image_data))
+    # JPEGs decode straight to a reduced scale via libjpeg's scaled IDCT
+    img.draft("JPEG", (size[0] * 2, size[1] * 2))
+    # reduce() and LANCZOS need real colour channels rather than palette indices
+    if img.mode not in ("RGB", "RGBA", "L", "LA"):
+        img = img.convert("RGBA" if img.mode == "PA" or "transparency" in img.info else "RGB")
+    # Cheap integer box reduction down to ~2x the target before the final LANCZOS pass
+    factor = max(1, min(img.size) // (size[0] * 2))
+    if factor > 1:
+        img = img.reduce(factor)
+    img.thumbnail(size, Image.LANCZOS)
     return img
 
+def make_thumbnail_data(image_data, size=(100, 100)):
+    """Encode a thumbnail for stored image bytes, or None if they cannot be decoded."""
+    try:
+        thumbnail = generate_thumbnail(image_data, size)
+        output = io.BytesIO()
+        # PNG only where there is transparency to keep; JPEG is far smaller and faster for photos
+        if thumbnail.mode in ("RGBA", "LA") or "transparency" in thumbnail.info:
+            thumbnail.save(output, format="PNG")
+        else:
+            if thumbnail.mode not in ("RGB", "L"):
+                thumbnail = thumbnail.convert("RGB")
+            thumbnail.save(output, format="JPEG", quality=85)
+        return output.getvalue()
+    except Exception:
+        return None
+
+@st.cache_resource
+def check_pillow_build():
+    """Log once per process when Pillow is not the SIMD build used for fast LANCZOS resizes."""
+    # pillow-simd releases carry a ".postN" suffix on the upstream version they track
+    if ".post" not in PIL.__version__:
+        logging.getLogger(__name__).warning(
+            "Pillow %s is not a pillow-simd build; thumbnail resizes will use the scalar code path. "
+            "Install it with: pip install --force-reinstall --no-deps pillow-simd", PIL.__version__)
+
+def save_media_file(folder, name, image_data):
+    """Write image bytes to MEDIA_DIR and return the stored path."""
+    path = os.path.join(MEDIA_DIR, folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write beside the target and rename so readers never see a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(image_data)
+    os.replace(tmp_path, path)
+    return path
+
+def _remove_media_files(paths):
+    """Remove image files that no longer have a database row."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+@st.cache_resource
+def get_file_pool():
+    """Small process-wide pool for background media work, instead of a new thread per task."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="media-files")
+
+def remove_media_files(paths):
+    """Remove image files in the background so the UI does not wait on disk I/O."""
+    get_file_pool().submit(_remove_media_files, list(paths))
+
 def validate_folder_name(folder):
     """Validate folder name: alphanumeric, underscores, lowercase, 3-20 characters."""
     pattern = r"^[a-z0-9_]{3,20}$"
     return bool(re.match(pattern, folder))
 
+@st.cache_resource
+def get_conn():
+    """Return the process-wide gallery connection (autocommit, tuned PRAGMAs)."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+@st.cache_resource
+def get_write_lock():
+    """Return the lock that serializes writers on the shared connection."""
+    return threading.Lock()
+
+@st.cache_resource
+def _data_versions():
+    """Return the process-wide version counters that key the cached readers."""
+    return {}
+
+def _bump_version(key):
+    """Invalidate cached reads for a folder (or "folders" for the folder list)."""
+    versions = _data_versions()
+    versions[key] = versions.get(key, 0) + 1
+
+@contextmanager
+def write_transaction():
+    """Run a multi-statement write atomically on the shared connection."""
+    c = get_conn().cursor()
+    with get_write_lock():
+        c.execute("BEGIN")
+        try:
+            yield c
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+
+@st.cache_resource
 def init_db():
-    """Initialize SQLite database with folders, images, and surveys tables."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS folders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            folder TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            age INTEGER NOT NULL,
-            profession TEXT NOT NULL,
-            category TEXT NOT NULL
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS images (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            folder TEXT NOT NULL,
-            image_data BLOB NOT NULL,
-            download_allowed BOOLEAN NOT NULL DEFAULT 1,
-            FOREIGN KEY(folder) REFERENCES folders(folder)
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS surveys (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            folder TEXT NOT NULL,
-            rating INTEGER NOT NULL,
-            feedback TEXT,
-            timestamp TEXT NOT NULL,
-            FOREIGN KEY(folder) REFERENCES folders(folder)
-        )
-    """)
-    default_folders = [
-        {"name": "Sarika", "age": 28, "profession": "Photographer", "category": "Artists", "folder": "sarika"},
-        {"name": "Jamuna", "age": 32, "profession": "Sculptor", "category": "Artists", "folder": "jamuna"},
-    ]
-    for folder_data in default_folders:
-        c.execute("SELECT COUNT(*) FROM folders WHERE folder = ?", (folder_data["folder"],))
-        if c.fetchone()[0] == 0:
+    """Initialize SQLite database with folders, image metadata, and surveys tables."""
+    conn = get_conn()
+    # WAL is persistent in the database file, so setting it once here covers every connection
+    conn.execute("PRAGMA journal_mode=WAL")
+    with write_transaction() as c:
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS folders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                folder TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL,
+                age INTEGER NOT NULL,
+                profession TEXT NOT NULL,
+                category TEXT NOT NULL
+            )
+        """)
+        # Full-text index over the searchable folder columns, kept in sync by triggers
+        fts_exists = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'folders_fts'").fetchone()
+        c.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS folders_fts
+            USING fts5(folder, name, profession, category, content='folders', content_rowid='id')
+        """)
+        if not fts_exists:
+            c.execute("INSERT INTO folders_fts(folders_fts) VALUES ('rebuild')")
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS folders_fts_ai AFTER INSERT ON folders BEGIN
+                INSERT INTO folders_fts(rowid, folder, name, profession, category)
+                VALUES (new.id, new.folder, new.name, new.profession, new.category);
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS folders_fts_ad AFTER DELETE ON folders BEGIN
+                INSERT INTO folders_fts(folders_fts, rowid, folder, name, profession, category)
+                VALUES ('delete', old.id, old.folder, old.name, old.profession, old.category);
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS folders_fts_au AFTER UPDATE ON folders BEGIN
+                INSERT INTO folders_fts(folders_fts, rowid, folder, name, profession, category)
+                VALUES ('delete', old.id, old.folder, old.name, old.profession, old.category);
+                INSERT INTO folders_fts(rowid, folder, name, profession, category)
+                VALUES (new.id, new.folder, new.name, new.profession, new.category);
+            END
+        """)
+        # Older databases keep everything in one images table; bake any missing thumbnails before migrating it
+        legacy = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images'").fetchone()
+        if legacy and "thumbnail_data" not in [r[1] for r in c.execute("PRAGMA table_info(images)")]:
+            c.execute("ALTER TABLE images ADD COLUMN thumbnail_data BLOB")
+            rows = c.execute("SELECT id, image_data FROM images").fetchall()
+            c.executemany("UPDATE images SET thumbnail_data = ? WHERE id = ?",
+                          [(make_thumbnail_data(data), image_id) for image_id, data in rows])
+        # Per-image metadata stays in SQLite; the full-size image is a file under MEDIA_DIR
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS images_meta (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                download_allowed BOOLEAN NOT NULL DEFAULT 1,
+                thumbnail_data BLOB,
+                path TEXT,
+                FOREIGN KEY(folder) REFERENCES folders(folder)
+            )
+        """)
+        if "path" not in [r[1] for r in c.execute("PRAGMA table_info(images_meta)")]:
+            c.execute("ALTER TABLE images_meta ADD COLUMN path TEXT")
+        if legacy:
             c.execute("""
-                INSERT INTO folders (folder, name, age, profession, category)
-                VALUES (?, ?, ?, ?, ?)
-            """, (folder_data["folder"], folder_data["name"], folder_data["age"],
-                  folder_data["profession"], folder_data["category"]))
-    conn.commit()
-    conn.close()
+                INSERT INTO images_meta (id, name, folder, download_allowed, thumbnail_data)
+                SELECT id, name, folder, download_allowed, thumbnail_data FROM images
+            """)
+            blob_table = "images"
+        elif c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images_blob'").fetchone():
+            blob_table = "images_blob"
+        else:
+            blob_table = None
+        # Move BLOBs left by older layouts out to disk, then drop the table that held them
+        if blob_table:
+            rows = c.execute(f"SELECT m.id, m.folder, m.name, b.image_data FROM images_meta m JOIN {blob_table} b ON b.id = m.id").fetchall()
+            c.executemany("UPDATE images_meta SET path = ? WHERE id = ?",
+                          [(save_media_file(folder, name, data), image_id) for image_id, folder, name, data in rows])
+            c.execute(f"DROP TABLE {blob_table}")
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_images_meta_folder_name ON images_meta(folder, name)")
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS surveys (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                folder TEXT NOT NULL,
+                rating INTEGER NOT NULL,
+                feedback TEXT,
+                timestamp TEXT NOT NULL,
+                FOREIGN KEY(folder) REFERENCES folders(folder)
+            )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_surveys_folder_ts ON surveys(folder, timestamp)")
+        c.executemany("""
+            INSERT OR IGNORE INTO folders (folder, name, age, profession, category)
+            VALUES (?, ?, ?, ?, ?)
+        """, DEFAULT_FOLDERS)
 
 def load_folders(search_query=""):
     """Load folders from database, optionally filtered by search query."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    query = "SELECT folder, name, age, profession, category FROM folders WHERE name LIKE ? OR folder LIKE ? OR profession LIKE ? OR category LIKE ?"
-    c.execute(query, (f"%{search_query}%", f"%{search_query}%", f"%{search_query}%", f"%{search_query}%"))
+    return _load_folders_cached(search_query, _data_versions().get("folders", 0))
+
+@st.cache_data(show_spinner=False)
+def _load_folders_cached(search_query, version):
+    """Cached body of load_folders; version changes whenever a folder is added."""
+    c = get_conn().cursor()
+    query = "SELECT folder, name, age, profession, category FROM folders"
+    if search_query.strip():
+        # Quote each word as an FTS5 prefix term so user input can never break the MATCH syntax
+        terms = re.findall(r"\w+", search_query)
+        if not terms:
+            return []
+        c.execute(query + " WHERE id IN (SELECT rowid FROM folders_fts WHERE folders_fts MATCH ?)",
+                  (" ".join(f'"{t}"*' for t in terms),))
+    else:
+        c.execute(query)
     folders = [{"folder": r[0], "name": r[1], "age": r[2], "profession": r[3], "category": r[4]} for r in c.fetchall()]
-    conn.close()
     return folders
 
 def add_folder(folder, name, age, profession, category):
@@ -98,14 +270,12 @@ def add_folder(folder, name, age, profession, category):
         st.error("Folder name must be 3-20 characters, lowercase alphanumeric or underscores.")
         return False
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO folders (folder, name, age, profession, category)
-            VALUES (?, ?, ?, ?, ?)
-        """, (folder, name, age, profession, category))
-        conn.commit()
-        conn.close()
+        with get_write_lock():
+            get_conn().execute("""
+                INSERT INTO folders (folder, name, age, profession, category)
+                VALUES (?, ?, ?, ?, ?)
+            """, (folder, name, age, profession, category))
+        _bump_version("folders")
         return True
     except sqlite3.IntegrityError:
         st.error(f"Folder '{folder}' already exists.")
@@ -115,30 +285,35 @@ def add_folder(folder, name, age, profession, category):
         return False
 
 def load_images_to_db(uploaded_files, folder, download_allowed=True):
-    """Load images into the database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    for uploaded_file in uploaded_files:
-        image_data = uploaded_file.read()
-        extension = os.path.splitext(uploaded_file.name)[1].lower()
-        random_filename = f"{uuid.uuid4()}{extension}"
-        c.execute("SELECT COUNT(*) FROM images WHERE folder = ? AND name = ?", (folder, random_filename))
-        if c.fetchone()[0] == 0:
-            c.execute("INSERT INTO images (name, folder, image_data, download_allowed) VALUES (?, ?, ?, ?)",
-                      (random_filename, folder, image_data, download_allowed))
-    conn.commit()
-    conn.close()
+    """Load images into the database in a single transaction."""
+    datas = [u.read() for u in uploaded_files]
+    # Thumbnailing is decode+resize work that PIL runs without the GIL, so do the uploads in parallel
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        thumbnails = list(executor.map(make_thumbnail_data, datas))
+    rows = []
+    for u, image_data, thumbnail_data in zip(uploaded_files, datas, thumbnails):
+        name = f"{uuid.uuid4()}{os.path.splitext(u.name)[1].lower()}"
+        path = save_media_file(folder, name, image_data)
+        rows.append((name, folder, thumbnail_data, download_allowed, path))
+    try:
+        with write_transaction() as c:
+            c.executemany("INSERT OR IGNORE INTO images_meta (name, folder, thumbnail_data, download_allowed, path) VALUES (?, ?, ?, ?, ?)",
+                          rows)
+    except Exception:
+        remove_media_files(row[4] for row in rows)
+        raise
+    _bump_version(folder)
 
 def swap_image(folder, old_image_name, new_image_file):
     """Replace an existing image with a new uploaded image."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
         new_image_data = new_image_file.read()
-        c.execute("UPDATE images SET image_data = ? WHERE folder = ? AND name = ?",
-                  (new_image_data, folder, old_image_name))
-        conn.commit()
-        conn.close()
+        thumbnail_data = make_thumbnail_data(new_image_data)
+        path = save_media_file(folder, old_image_name, new_image_data)
+        with get_write_lock():
+            get_conn().execute("UPDATE images_meta SET thumbnail_data = ?, path = ? WHERE folder = ? AND name = ?",
+                               (thumbnail_data, path, folder, old_image_name))
+        _bump_version(folder)
         return True
     except Exception as e:
         st.error(f"Error swapping image: {str(e)}")
@@ -146,85 +321,150 @@ def swap_image(folder, old_image_name, new_image_file):
 
 def update_download_permission(folder, image_name, download_allowed):
     """Update download permission for an image."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE images SET download_allowed = ? WHERE folder = ? AND name = ?",
-              (download_allowed, folder, image_name))
-    conn.commit()
-    conn.close()
+    with get_write_lock():
+        get_conn().execute("UPDATE images_meta SET download_allowed = ? WHERE folder = ? AND name = ?",
+                           (download_allowed, folder, image_name))
+    _bump_version(folder)
 
 def delete_image(folder, name):
-    """Delete an image from the database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM images WHERE folder = ? AND name = ?", (folder, name))
-    conn.commit()
-    conn.close()
-
-def load_survey_data():
-    """Load survey data from database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT folder, rating, feedback, timestamp FROM surveys")
-    survey_data = {}
-    for row in c.fetchall():
-        folder, rating, feedback, timestamp = row
-        if folder not in survey_data:
-            survey_data[folder] = []
-        survey_data[folder].append({"rating": rating, "feedback": feedback, "timestamp": timestamp})
-    conn.close()
-    return survey_data
+    """Delete an image from the database and its file from disk."""
+    with write_transaction() as c:
+        paths = [r[0] for r in c.execute("SELECT path FROM images_meta WHERE folder = ? AND name = ?", (folder, name))]
+        c.execute("DELETE FROM images_meta WHERE folder = ? AND name = ?", (folder, name))
+    remove_media_files(paths)
+    _bump_version(folder)
+
+def format_timestamp(timestamp):
+    """Format a stored ISO timestamp for display, leaving anything unparseable as it is."""
+    try:
+        return datetime.fromisoformat(timestamp).strftime("%Y-%m-%d %H:%M")
+    except (TypeError, ValueError):
+        return timestamp
+
+def get_surveys(folder):
+    """Load the most recent survey entries for a folder."""
+    return _get_surveys_cached(folder, _data_versions().get(f"surveys_{folder}", 0))
+
+@st.cache_data(show_spinner=False)
+def _get_surveys_cached(folder, version):
+    """Cached body of get_surveys; version changes whenever the folder's surveys do."""
+    c = get_conn().cursor()
+    c.execute("SELECT id, rating, feedback, timestamp FROM surveys WHERE folder = ? ORDER BY timestamp DESC LIMIT ?",
+              (folder, SURVEY_PAGE_SIZE))
+    # Star strings and display times are built here, once per cached read, rather than on every render
+    return [{"id": survey_id, "rating": rating, "stars": "⭐" * rating, "feedback": feedback,
+             "timestamp": timestamp, "ts_display": format_timestamp(timestamp)}
+            for survey_id, rating, feedback, timestamp in c.fetchall()]
+
+def load_survey_aggregates():
+    """Load average rating and review count per folder."""
+    return _load_survey_aggregates_cached(_data_versions().get("surveys", 0))
+
+@st.cache_data(show_spinner=False)
+def _load_survey_aggregates_cached(version):
+    """Cached body of load_survey_aggregates; version changes whenever a survey is saved or deleted."""
+    c = get_conn().cursor()
+    c.execute("SELECT folder, AVG(rating), COUNT(*) FROM surveys GROUP BY folder")
+    return {folder: (avg_rating, count) for folder, avg_rating, count in c.fetchall()}
 
 def save_survey_data(folder, rating, feedback, timestamp):
     """Save survey data to database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO surveys (folder, rating, feedback, timestamp) VALUES (?, ?, ?, ?)",
-              (folder, rating, feedback, timestamp))
-    conn.commit()
-    conn.close()
-
-def delete_survey_entry(folder, timestamp):
+    with get_write_lock():
+        get_conn().execute("INSERT INTO surveys (folder, rating, feedback, timestamp) VALUES (?, ?, ?, ?)",
+                           (folder, rating, feedback, timestamp))
+    _bump_version("surveys")
+    _bump_version(f"surveys_{folder}")
+
+def delete_survey_entry(folder, survey_id):
     """Delete a survey entry from database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM surveys WHERE folder = ? AND timestamp = ?", (folder, timestamp))
-    conn.commit()
-    conn.close()
-
-def get_images(folder):
-    """Get images from database for a folder."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT name, image_data, download_allowed FROM images WHERE folder = ?", (folder,))
-    images = []
-    for r in c.fetchall():
-        name, data, download = r
+    with get_write_lock():
+        get_conn().execute("DELETE FROM surveys WHERE folder = ? AND id = ?", (folder, survey_id))
+    _bump_version("surveys")
+    _bump_version(f"surveys_{folder}")
+
+def get_thumbnails(folder):
+    """Get image ids, names, thumbnails, file paths and download flags for a folder."""
+    return _get_thumbnails_cached(folder, _data_versions().get(folder, 0))
+
+# Every version bump leaves the previous entry behind, so bound the cache instead of letting it grow
+@st.cache_data(show_spinner=False, max_entries=64)
+def _get_thumbnails_cached(folder, version):
+    """Cached body of get_thumbnails; version changes whenever the folder's images do."""
+    c = get_conn().cursor()
+    c.execute("SELECT id, name, thumbnail_data, path, download_allowed FROM images_meta WHERE folder = ? ORDER BY id", (folder,))
+    return [{"id": image_id, "name": name, "thumbnail": thumbnail, "path": path, "download": download}
+            for image_id, name, thumbnail, path, download in c.fetchall()]
+
+def get_image_names(folder):
+    """Get image names for a folder, in grid order."""
+    return _get_image_names_cached(folder, _data_versions().get(folder, 0))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _get_image_names_cached(folder, version):
+    """Cached body of get_image_names; version changes whenever the folder's images do."""
+    c = get_conn().cursor()
+    c.execute("SELECT name FROM images_meta WHERE folder = ? ORDER BY id", (folder,))
+    return [r[0] for r in c.fetchall()]
+
+def get_display_image(path):
+    """Get the bytes the zoom view shows for an image: the file itself, or a copy downscaled to ZOOM_MAX_SIZE."""
+    return _get_display_image_cached(path, os.stat(path).st_mtime_ns)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _get_display_image_cached(path, mtime_ns):
+    """Cached body of get_display_image; mtime changes when a swap rewrites the file."""
+    with open(path, "rb") as fh:
+        image_data = fh.read()
+    with Image.open(io.BytesIO(image_data)) as img:
+        width, height = img.size
+    if width <= ZOOM_MAX_SIZE[0] and height <= ZOOM_MAX_SIZE[1]:
+        return image_data
+    return make_thumbnail_data(image_data, ZOOM_MAX_SIZE) or image_data
+
+def _prefetch_display_images(ctx, paths):
+    """Warm the get_display_image cache for images the user is likely to open next."""
+    # Pool threads outlive any one run, so each task attaches the context of the run that submitted it
+    add_script_run_ctx(threading.current_thread(), ctx)
+    for path in paths:
         try:
-            img = Image.open(io.BytesIO(data))
-            thumbnail = generate_thumbnail(img)
-            base64_image = image_to_base64(data)
-            images.append({
-                "name": name,
-                "image": img,
-                "thumbnail": thumbnail,
-                "data": data,
-                "download": download,
-                "base64": base64_image
-            })
-        except Exception as e:
-            st.error(f"Error loading image {name}: {str(e)}")
-    conn.close()
-    return images
-
-def display_rating_chart(survey_data, folders):
+            get_display_image(path)
+        except FileNotFoundError:
+            # The zoom view reports the missing file when it shows the image
+            pass
+        except Exception:
+            logging.getLogger(__name__).warning("Could not prefetch %s", path, exc_info=True)
+
+def prefetch_display_images(folder, names):
+    """Prepare the zoom copies of the given images on the media file pool."""
+    # Row lookups stay on the script thread; only the file reads and resizes move to the pool
+    images = [get_image(folder, name) for name in names]
+    paths = [img["path"] for img in images if img is not None]
+    if paths:
+        get_file_pool().submit(_prefetch_display_images, get_script_run_ctx(), paths)
+
+def get_image(folder, name):
+    """Get the id, file path and download flag of a single image, or None if it is gone."""
+    return _get_image_cached(folder, name, _data_versions().get(folder, 0))
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _get_image_cached(folder, name, version):
+    """Cached body of get_image; version changes whenever the folder's images do."""
+    c = get_conn().cursor()
+    c.execute("SELECT id, path, download_allowed FROM images_meta WHERE folder = ? AND name = ?", (folder, name))
+    row = c.fetchone()
+    if row is None:
+        return None
+    image_id, path, download = row
+    mime = "image/jpeg" if name.lower().endswith(('.jpg', '.jpeg')) else "image/png"
+    return {"id": image_id, "name": name, "path": path, "download": download, "mime": mime}
+
+def display_rating_chart(survey_aggregates, folders):
     """Display a bar chart of average ratings per folder."""
     ratings = []
     folder_names = []
     for f in folders:
-        if f["folder"] in survey_data and survey_data[f["folder"]]:
-            avg_rating = sum(entry["rating"] for entry in survey_data[f["folder"]]) / len(survey_data[f["folder"]])
-            ratings.append(avg_rating)
+        if f["folder"] in survey_aggregates:
+            ratings.append(survey_aggregates[f["folder"]][0])
             folder_names.append(f["name"])
     
     if ratings:
@@ -252,14 +492,79 @@ def display_rating_chart(survey_data, folders):
     else:
         st.info("No survey data available to display chart.")
 
+@st.fragment
+def feedback_panel(f):
+    """Survey form and previous feedback for one folder, rerun on its own when submitted or deleted."""
+    with st.form(key=f"survey_form_{f['folder']}"):
+        rating = st.slider("Rating (1-5)", 1, 5, 3, key=f"rating_{f['folder']}")
+        feedback = st.text_area("Feedback", key=f"feedback_{f['folder']}")
+        if st.form_submit_button("Submit"):
+            timestamp = datetime.now().isoformat()
+            save_survey_data(f["folder"], rating, feedback, timestamp)
+            st.success("✅ Response recorded")
+
+    # Read after the form so a just-submitted response shows up in this same fragment run
+    survey_aggregates = load_survey_aggregates()
+    if f["folder"] in survey_aggregates:
+        st.write("### 📊 Previous Feedback:")
+        avg_rating, review_count = survey_aggregates[f["folder"]]
+        st.markdown(f"**Average Rating:** ⭐ {avg_rating:.1f} ({review_count} reviews)")
+        if review_count > SURVEY_PAGE_SIZE:
+            st.caption(f"Showing the latest {SURVEY_PAGE_SIZE} of {review_count} comments.")
+        entries = get_surveys(f["folder"])
+        # One markdown element for the whole list instead of a columns+markdown pair per comment
+        html_parts = []
+        for n, entry in enumerate(entries, 1):
+            number = f"{n}. " if st.session_state.is_author else ""
+            html_parts.append(
+                f"<div>{number}{entry['stars']} — {html.escape(entry['feedback'] or '')}<br>"
+                f"<sub>🕒 {entry['ts_display']}</sub></div>"
+            )
+        st.markdown("".join(html_parts), unsafe_allow_html=True)
+        if st.session_state.is_author:
+            cols = st.columns(6)
+            for n, entry in enumerate(entries, 1):
+                with cols[(n - 1) % 6]:
+                    # Keyed on the row id: a click is delivered to the next run by key, and positions
+                    # shift whenever another session adds or removes a comment in between
+                    if st.button(f"🗑️ {n}", key=f"ds_{entry['id']}"):
+                        delete_survey_entry(f["folder"], entry["id"])
+                        st.success("Deleted comment.")
+                        st.rerun(scope="fragment")
+    else:
+        st.info("No feedback yet — be the first to leave a comment!")
+
+def set_zoom(folder, index=0):
+    """Open the zoom view at an image, or return to the grid with folder=None, and mirror it in the URL."""
+    st.session_state.zoom_folder = folder
+    st.session_state.zoom_index = index
+    if folder is None:
+        st.query_params.pop("folder", None)
+        st.query_params.pop("i", None)
+    else:
+        st.query_params["folder"] = folder
+        st.query_params["i"] = str(index)
+
+def delete_zoomed_image(folder, name, idx, count):
+    """Delete the image shown in the zoom view and move to its neighbour, or to the grid if it was the last."""
+    delete_image(folder, name)
+    st.toast("Deleted.")
+    if count == 1:
+        set_zoom(None)
+    else:
+        set_zoom(folder, max(0, idx - 1))
+
 # -------------------------------
 # Initialize DB & Session State
 # -------------------------------
 init_db()
+check_pillow_build()
+# The URL carries the zoom position, so a reload or shared link reopens the same image
 if "zoom_folder" not in st.session_state:
-    st.session_state.zoom_folder = None
+    st.session_state.zoom_folder = st.query_params.get("folder")
 if "zoom_index" not in st.session_state:
-    st.session_state.zoom_index = 0
+    zoom_param = st.query_params.get("i", "0")
+    st.session_state.zoom_index = int(zoom_param) if zoom_param.isdigit() else 0
 if "is_author" not in st.session_state:
     st.session_state.is_author = False
 
@@ -313,7 +618,7 @@ with st.sidebar:
 
         st.subheader("Image Swap")
         folder_choice_swap = st.selectbox("Select Folder for Image Swap", [item["folder"] for item in data], key="swap_folder")
-        images = get_images(folder_choice_swap)
+        images = get_thumbnails(folder_choice_swap)
         if images:
             image_choice = st.selectbox("Select Image to Swap", [img["name"] for img in images], key="swap_image")
             new_image = st.file_uploader("Upload New Image", type=['jpg', 'jpeg', 'png'], key="swap_upload")
@@ -325,8 +630,8 @@ with st.sidebar:
                     st.error("Failed to swap image.")
 
         st.subheader("Download Permissions")
-        folder_choice_perm = st.selectbox("Select Folder for Download Settings", [item["folder"] for item in data], key=f"download_folder_{uuid.uuid4()}")
-        images = get_images(folder_choice_perm)
+        folder_choice_perm = st.selectbox("Select Folder for Download Settings", [item["folder"] for item in data], key="download_folder_perm")
+        images = get_thumbnails(folder_choice_perm)
         if images:
             with st.form(key=f"download_permissions_form_{folder_choice_perm}"):
                 st.write("Toggle Download Permissions:")
@@ -365,10 +670,10 @@ st.title("📸 Interactive Photo Gallery & Survey")
 # Search Bar
 search_query = st.text_input("Search by name, folder, profession, or category")
 data = load_folders(search_query)
-survey_data = load_survey_data()
+survey_aggregates = load_survey_aggregates()
 
 # Display Rating Chart
-display_rating_chart(survey_data, data)
+display_rating_chart(survey_aggregates, data)
 
 categories = sorted(set(item["category"] for item in data))
 tabs = st.tabs(categories)
@@ -385,90 +690,65 @@ if st.session_state.zoom_folder is None:
                     unsafe_allow_html=True
                 )
 
-                images = get_images(f["folder"])
+                images = get_thumbnails(f["folder"])
                 if images:
                     cols = st.columns(4)
                     for idx, img_dict in enumerate(images):
                         with cols[idx % 4]:
-                            if st.button("🔍 View", key=f"view_{f['folder']}_{idx}"):
-                                st.session_state.zoom_folder = f["folder"]
-                                st.session_state.zoom_index = idx
-                                st.rerun()
-                            st.image(img_dict["thumbnail"], use_container_width=True)
+                            # Callbacks update state before the rerun they trigger, so no extra st.rerun() pass
+                            st.button("🔍 View", key=f"view_{f['folder']}_{idx}", on_click=set_zoom, args=(f["folder"], idx))
+                            if img_dict["thumbnail"]:
+                                st.image(img_dict["thumbnail"], use_container_width=True)
+                            else:
+                                st.error(f"Error loading image {img_dict['name']}")
                 else:
                     st.warning(f"No images found for {f['folder']}")
 
                 with st.expander(f"📝 Survey for {f['name']}"):
-                    with st.form(key=f"survey_form_{f['folder']}"):
-                        rating = st.slider("Rating (1-5)", 1, 5, 3, key=f"rating_{f['folder']}")
-                        feedback = st.text_area("Feedback", key=f"feedback_{f['folder']}")
-                        if st.form_submit_button("Submit"):
-                            timestamp = datetime.now().isoformat()
-                            save_survey_data(f["folder"], rating, feedback, timestamp)
-                            st.success("✅ Response recorded")
-                            st.rerun()
-
-                    if f["folder"] in survey_data and survey_data[f["folder"]]:
-                        st.write("### 📊 Previous Feedback:")
-                        ratings = [entry['rating'] for entry in survey_data[f["folder"]]]
-                        avg_rating = sum(ratings) / len(ratings)
-                        st.markdown(f"**Average Rating:** ⭐ {avg_rating:.1f} ({len(ratings)} reviews)")
-                        for entry in survey_data[f["folder"]]:
-                            cols = st.columns([6, 1])
-                            with cols[0]:
-                                rating_display = "⭐" * entry["rating"]
-                                st.markdown(
-                                    f"- {rating_display} — {entry['feedback']}  \n"
-                                    f"<sub>🕒 {entry['timestamp']}</sub>",
-                                    unsafe_allow_html=True
-                                )
-                            if st.session_state.is_author:
-                                with cols[1]:
-                                    if st.button("🗑️", key=f"delete_survey_{f['folder']}_{entry['timestamp']}"):
-                                        delete_survey_entry(f["folder"], entry["timestamp"])
-                                        st.success("Deleted comment.")
-                                        st.rerun()
-                    else:
-                        st.info("No feedback yet — be the first to leave a comment!")
+                    feedback_panel(f)
 
 # Zoom View
 else:
     folder = st.session_state.zoom_folder
-    images = get_images(folder)
+    # Only the shown image is looked up; the rest of the folder is just a list of names
+    names = get_image_names(folder)
+    if not names:
+        # A stale link or a folder emptied elsewhere: nothing to zoom into
+        set_zoom(None)
+        st.rerun()
     idx = st.session_state.zoom_index
-    if idx >= len(images):
+    if idx >= len(names):
         idx = 0
-        st.session_state.zoom_index = 0
-    img_dict = images[idx]
-
-    st.subheader(f"🔍 Viewing {folder} ({idx+1}/{len(images)})")
-    st.image(img_dict["image"], use_container_width=True)
+        set_zoom(folder, 0)
+    img_dict = get_image(folder, names[idx])
+
+    st.subheader(f"🔍 Viewing {folder} ({idx+1}/{len(names)})")
+    # media/ is not part of the backup, so a row can outlive its file; report it instead of crashing
+    file_present = os.path.exists(img_dict["path"])
+    if file_present:
+        # Downloads still serve the original file; the on-screen copy only needs screen resolution
+        st.image(get_display_image(img_dict["path"]), use_container_width=True)
+    else:
+        st.error(f"Image file for {img_dict['name']} is missing.")
 
     col1, col2, col3 = st.columns([1, 8, 1])
     with col1:
-        if idx > 0 and st.button("◄ Previous", key=f"prev_{folder}"):
-            st.session_state.zoom_index -= 1
-            st.rerun()
+        if idx > 0:
+            st.button("◄ Previous", key=f"prev_{folder}", on_click=set_zoom, args=(folder, idx - 1))
     with col3:
-        if idx < len(images) - 1 and st.button("Next ►", key=f"next_{folder}"):
-            st.session_state.zoom_index += 1
-            st.rerun()
+        if idx < len(names) - 1:
+            st.button("Next ►", key=f"next_{folder}", on_click=set_zoom, args=(folder, idx + 1))
 
-    if img_dict["download"]:
-        mime = "image/jpeg" if img_dict["name"].lower().endswith(('.jpg', '.jpeg')) else "image/png"
-        st.download_button("⬇️ Download", data=img_dict["data"], file_name=img_dict["name"], mime=mime)
+    if img_dict["download"] and file_present:
+        with open(img_dict["path"], "rb") as fh:
+            st.download_button("⬇️ Download", data=fh.read(), file_name=img_dict["name"], mime=img_dict["mime"])
 
     if st.session_state.is_author:
-        if st.button("🗑️ Delete Image", key=f"delete_{folder}_{img_dict['name']}"):
-            delete_image(folder, img_dict["name"])
-            st.success("Deleted.")
-            st.session_state.zoom_index = max(0, idx - 1)
-            if len(get_images(folder)) == 0:
-                st.session_state.zoom_folder = None
-                st.session_state.zoom_index = 0
-            st.rerun()
+        # names was read before the delete, so the callback knows whether the folder empties
+        st.button("🗑️ Delete Image", key=f"del_{folder}_{idx}", on_click=delete_zoomed_image,
+                  args=(folder, img_dict["name"], idx, len(names)))
 
-    if st.button("⬅️ Back to Grid", key=f"back_{folder}"):
-        st.session_state.zoom_folder = None
-        st.session_state.zoom_index = 0
-        st.rerun()
+    st.button("⬅️ Back to Grid", key=f"back_{folder}", on_click=set_zoom, args=(None,))
+
+    # Previous/Next are the likely next clicks, so have their images ready
+    prefetch_display_images(folder, names[max(0, idx - 1):idx] + names[idx + 1:idx + 2])
@@ -1,36 +1,62 @@
 import streamlit as st
 import sqlite3
 import io
-from PIL import Image
+from PIL import Image, features
 import os
 from datetime import datetime
 import uuid
+import threading
+import time
+import atexit
+import gc
+import logging
 import re
+import html
+import functools
 import base64
+import mmap
 import json
+from contextlib import contextmanager
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import git
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 REPO_URL = os.getenv("REPO_URL", "https://github.com/coffeecode19345/dristee1.git")
+GITHUB_BRANCH = os.getenv("GITHUB_BRANCH")  # Branch backups are committed to; defaults to the repo's default branch
 DB_PATH = "gallery.db"
-BACKUP_PATH = "data/db_backup.json"
+BACKUP_PATH = "data/db_backup.db"
+IMAGE_DIR = "data/images"  # Image files live here; the database keeps only their paths
+LEGACY_BACKUP_PATH = "data/db_backup.json"  # Restored once if no db_backup.db exists yet
+BACKUP_FLUSH_INTERVAL = 5  # Seconds between background backup flushes
+BACKUP_RETRY_MAX_INTERVAL = 300  # Longest wait between retries of a failing backup flush
+_HTTPS_RE = re.compile(r'https?://[^/]+/([^/]+)/([^/]+?)(?:\.git)?$')
+_SSH_RE = re.compile(r'git@[^:]+:([^/]+)/([^/]+?)(?:\.git)?$')
+_FOLDER_NAME_RE = re.compile(r"^[a-z0-9_]{3,20}$")
+_SEARCH_TERM_RE = re.compile(r"\w+")
 
 # -------------------------------
 # GitHub Helper Function
 # -------------------------------
+@functools.lru_cache(maxsize=4)
 def _parse_github_repo_info(repo_url):
     """Return (owner, repo) from a repo url like https://github.com/owner/repo.git or git@github.com:owner/repo.git"""
     if not repo_url:
         return None, None
-    m = re.search(r'https?://[^/]+/([^/]+)/([^/]+?)(?:\.git)?$', repo_url)
+    m = _HTTPS_RE.search(repo_url)
     if m:
         return m.group(1), m.group(2)
-    m = re.search(r'git@[^:]+:([^/]+)/([^/]+?)(?:\.git)?$', repo_url)
+    m = _SSH_RE.search(repo_url)
     if m:
         return m.group(1), m.group(2)
     parts = repo_url.strip().split('/')
@@ -38,50 +64,167 @@ def _parse_github_repo_info(repo_url):
         return parts[0], parts[1].replace('.git', '')
     return None, None
 
+# -------------------------------
+# Database Connection
+# -------------------------------
+@st.cache_resource
+def get_conn():
+    """Return the process-wide gallery connection (autocommit, tuned PRAGMAs)."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-20000")
+    return conn
+
+@st.cache_resource
+def get_write_lock():
+    """Return the lock that serializes writers on the shared connection."""
+    return threading.Lock()
+
+@st.cache_resource
+def _data_versions():
+    """Return the process-wide version counters that key the cached readers."""
+    return {}
+
+def _bump_version(key):
+    """Invalidate cached reads for a folder."""
+    versions = _data_versions()
+    versions[key] = versions.get(key, 0) + 1
+
+@contextmanager
+def write_transaction():
+    """Run a multi-statement write atomically on the shared connection."""
+    c = get_conn().cursor()
+    with get_write_lock():
+        # IMMEDIATE takes SQLite's write lock up front, so another process can't make the
+        # read-to-write upgrade fail with SQLITE_BUSY halfway through the transaction
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            yield c
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+
 # -------------------------------
 # Backup and Restore Functions
 # -------------------------------
-def serialize_db():
-    """Serialize the SQLite database to a JSON structure."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    data = {
-        "folders": [],
-        "images": [],
-        "surveys": []
-    }
-    c.execute("SELECT folder, name, age, profession, category FROM folders")
-    data["folders"] = [{"folder": r[0], "name": r[1], "age": r[2], "profession": r[3], "category": r[4]} for r in c.fetchall()]
-    c.execute("SELECT name, folder, image_data, download_allowed FROM images")
-    data["images"] = [{"name": r[0], "folder": r[1], "image_data": base64.b64encode(r[2]).decode('utf-8'), "download_allowed": r[3]} for r in c.fetchall()]
-    c.execute("SELECT folder, rating, feedback, timestamp FROM surveys")
-    data["surveys"] = [{"folder": r[0], "rating": r[1], "feedback": r[2], "timestamp": r[3]} for r in c.fetchall()]
-    conn.close()
-    return data
+def write_snapshot():
+    """Snapshot the database to db_backup.db with VACUUM INTO."""
+    os.makedirs(os.path.dirname(BACKUP_PATH), exist_ok=True)
+    tmp_path = f"{BACKUP_PATH}.tmp"
+    # VACUUM INTO refuses to overwrite, so clear any leftover from an interrupted snapshot
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    # A connection of its own: the shared one may have readers mid-iteration, which makes
+    # VACUUM fail with "SQL statements in progress". In WAL mode this connection reads a
+    # committed snapshot, so it never captures half of a transaction and needs no writer lock.
+    # VACUUM INTO writes a compacted copy without the free pages the live database accumulates
+    src = sqlite3.connect(DB_PATH)
+    try:
+        src.execute("VACUUM INTO ?", (tmp_path,))
+    finally:
+        src.close()
+    # Keep the snapshot a single self-contained file rather than a WAL database
+    dst = sqlite3.connect(tmp_path)
+    try:
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dst.close()
+    os.replace(tmp_path, BACKUP_PATH)
+
+@st.cache_resource
+def _backup_state():
+    """Return the process-wide dirty flag and flush lock for debounced backups."""
+    return {"dirty": threading.Event(), "lock": threading.Lock()}
 
 def save_backup():
-    """Save the serialized database to db_backup.json."""
-    data = serialize_db()
-    os.makedirs(os.path.dirname(BACKUP_PATH), exist_ok=True)
-    with open(BACKUP_PATH, "w") as f:
-        json.dump(data, f)
-    commit_backup_api()
+    """Mark the database as changed; the background flusher snapshots and commits it."""
+    _backup_state()["dirty"].set()
+
+def flush_backup(force=False):
+    """Snapshot and commit the backup if anything changed since the last flush (or always, if forced).
+
+    Returns None when nothing was pending, otherwise whether the snapshot was committed.
+    """
+    state = _backup_state()
+    with state["lock"]:
+        if not (force or state["dirty"].is_set()):
+            return None
+        # Cleared before the snapshot so a write landing mid-flush marks the next one dirty;
+        # any failure puts the flag back so the pending backup is retried, not dropped
+        state["dirty"].clear()
+        try:
+            write_snapshot()
+            ok = commit_backup_api()
+        except BaseException:
+            state["dirty"].set()
+            raise
+        if not ok:
+            state["dirty"].set()
+        return ok
+
+@st.cache_resource
+def start_backup_flusher():
+    """Start the daemon thread that flushes pending backups every BACKUP_FLUSH_INTERVAL seconds."""
+    def run():
+        delay = BACKUP_FLUSH_INTERVAL
+        while True:
+            time.sleep(delay)
+            try:
+                ok = flush_backup()
+            except Exception:
+                logger.exception("Background backup flush failed")
+                ok = False
+            # Back off while GitHub keeps failing, so a bad token isn't retried every few seconds
+            delay = BACKUP_FLUSH_INTERVAL if ok is not False else min(delay * 2, BACKUP_RETRY_MAX_INTERVAL)
+    thread = threading.Thread(target=run, name="backup-flusher", daemon=True)
+    thread.start()
+    # The daemon thread dies with the process, so flush whatever is still pending on shutdown
+    atexit.register(flush_on_exit)
+    return thread
+
+def flush_on_exit():
+    """Flush a pending backup at interpreter exit, logging rather than raising on failure."""
+    try:
+        flush_backup()
+    except Exception:
+        logger.exception("Backup flush at exit failed")
 
 def restore_db():
-    """Restore gallery.db from db_backup.json if it exists — robust to empty/corrupt backups."""
+    """Restore gallery.db from db_backup.db, falling back to a legacy db_backup.json."""
+    # Only a fresh database is restored: backups are flushed lazily, so an existing
+    # gallery.db can be newer than the snapshot and must not be overwritten by it
+    if get_conn().execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'folders'").fetchone():
+        return
     if not os.path.exists(BACKUP_PATH):
+        restore_json_backup()
+        return
+    src = sqlite3.connect(BACKUP_PATH)
+    try:
+        with get_write_lock():
+            src.backup(get_conn())
+    except sqlite3.Error as e:
+        st.error(f"Failed to restore database from {BACKUP_PATH}: {e}")
+    finally:
+        src.close()
+
+def restore_json_backup():
+    """Restore gallery.db from db_backup.json if it exists — robust to empty/corrupt backups."""
+    if not os.path.exists(LEGACY_BACKUP_PATH):
         st.info(f"No backup file found at {BACKUP_PATH}. Starting with a fresh database.")
         return
     try:
-        with open(BACKUP_PATH, "r", encoding="utf-8") as f:
+        with open(LEGACY_BACKUP_PATH, "r", encoding="utf-8") as f:
             raw = f.read()
         if not raw or not raw.strip():
-            st.warning(f"Backup file {BACKUP_PATH} exists but is empty. Add folders or images to populate the database.")
+            st.warning(f"Backup file {LEGACY_BACKUP_PATH} exists but is empty. Add folders or images to populate the database.")
             return
         try:
             backup = json.loads(raw)
         except json.JSONDecodeError as e:
-            st.error(f"Backup file is not valid JSON: {e}. Please check or regenerate {BACKUP_PATH}.")
+            st.error(f"Backup file is not valid JSON: {e}. Please check or regenerate {LEGACY_BACKUP_PATH}.")
             return
         if not isinstance(backup, dict):
             st.error("Backup JSON root must be an object/dict. Aborting restore.")
@@ -93,270 +236,471 @@ def restore_db():
             if not isinstance(backup[key], list):
                 st.error(f"Backup key '{key}' must be a list. Aborting restore.")
                 return
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
         try:
-            c.execute("BEGIN")
-            c.execute("DROP TABLE IF EXISTS folders")
-            c.execute("DROP TABLE IF EXISTS images")
-            c.execute("DROP TABLE IF EXISTS surveys")
-            c.execute("""
-                CREATE TABLE folders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    folder TEXT UNIQUE NOT NULL,
-                    name TEXT NOT NULL,
-                    age INTEGER NOT NULL,
-                    profession TEXT NOT NULL,
-                    category TEXT NOT NULL
-                )
-            """)
-            c.execute("""
-                CREATE TABLE images (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    folder TEXT NOT NULL,
-                    image_data BLOB NOT NULL,
-                    download_allowed BOOLEAN NOT NULL DEFAULT 1,
-                    FOREIGN KEY(folder) REFERENCES folders(folder)
-                )
-            """)
-            c.execute("""
-                CREATE TABLE surveys (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    folder TEXT NOT NULL,
-                    rating INTEGER NOT NULL,
-                    feedback TEXT,
-                    timestamp TEXT NOT NULL,
-                    FOREIGN KEY(folder) REFERENCES folders(folder)
-                )
-            """)
-            skipped = {"folders":0, "images":0, "surveys":0}
-            for idx, fld in enumerate(backup["folders"]):
-                try:
-                    folder = fld["folder"]
-                    name = fld["name"]
-                    age = int(fld["age"])
-                    profession = fld["profession"]
-                    category = fld["category"]
-                    c.execute(
-                        "INSERT INTO folders (folder, name, age, profession, category) VALUES (?, ?, ?, ?, ?)",
-                        (folder, name, age, profession, category)
+            with write_transaction() as c:
+                c.execute("DROP TABLE IF EXISTS folders")
+                c.execute("DROP TABLE IF EXISTS images")
+                c.execute("DROP TABLE IF EXISTS surveys")
+                c.execute("""
+                    CREATE TABLE folders (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        folder TEXT UNIQUE NOT NULL,
+                        name TEXT NOT NULL,
+                        age INTEGER NOT NULL,
+                        profession TEXT NOT NULL,
+                        category TEXT NOT NULL
                     )
-                except Exception as e:
-                    skipped["folders"] += 1
-                    st.warning(f"Skipping malformed folder entry #{idx}: {e}")
-            for idx, img in enumerate(backup["images"]):
-                try:
-                    image_name = img["name"]
-                    folder = img["folder"]
-                    img_b64 = img.get("image_data")
-                    if not isinstance(img_b64, str) or not img_b64.strip():
-                        raise ValueError("image_data is missing or not a base64 string")
-                    image_bytes = base64.b64decode(img_b64)
-                    download_allowed = int(img.get("download_allowed", 1))
-                    c.execute(
-                        "INSERT INTO images (name, folder, image_data, download_allowed) VALUES (?, ?, ?, ?)",
-                        (image_name, folder, image_bytes, download_allowed)
+                """)
+                c.execute("""
+                    CREATE TABLE images (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        name TEXT NOT NULL,
+                        folder TEXT NOT NULL,
+                        path TEXT NOT NULL,
+                        download_allowed BOOLEAN NOT NULL DEFAULT 1,
+                        thumb BLOB,
+                        FOREIGN KEY(folder) REFERENCES folders(folder)
                     )
-                except Exception as e:
-                    skipped["images"] += 1
-                    st.warning(f"Skipping malformed image entry #{idx} ({img.get('name')}): {e}")
-            for idx, s in enumerate(backup["surveys"]):
-                try:
-                    folder = s["folder"]
-                    rating = int(s["rating"])
-                    feedback = s.get("feedback")
-                    timestamp = s["timestamp"]
-                    c.execute(
-                        "INSERT INTO surveys (folder, rating, feedback, timestamp) VALUES (?, ?, ?, ?)",
-                        (folder, rating, feedback, timestamp)
+                """)
+                # Created before the inserts so OR IGNORE really drops duplicate (folder, name) rows
+                c.execute("CREATE UNIQUE INDEX idx_images_folder_name ON images(folder, name)")
+                c.execute("""
+                    CREATE TABLE surveys (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        folder TEXT NOT NULL,
+                        rating INTEGER NOT NULL,
+                        feedback TEXT,
+                        timestamp TEXT NOT NULL,
+                        FOREIGN KEY(folder) REFERENCES folders(folder)
                     )
-                except Exception as e:
-                    skipped["surveys"] += 1
-                    st.warning(f"Skipping malformed survey entry #{idx}: {e}")
-            conn.commit()
+                """)
+                skipped = {"folders":0, "images":0, "surveys":0}
+                folder_rows, image_rows, survey_rows = [], [], []
+                seen_images = set()
+                for idx, fld in enumerate(backup["folders"]):
+                    try:
+                        folder = fld["folder"]
+                        name = fld["name"]
+                        age = int(fld["age"])
+                        profession = fld["profession"]
+                        category = fld["category"]
+                        folder_rows.append((folder, name, age, profession, category))
+                    except Exception as e:
+                        skipped["folders"] += 1
+                        st.warning(f"Skipping malformed folder entry #{idx}: {e}")
+                for idx, img in enumerate(backup["images"]):
+                    try:
+                        image_name = img["name"]
+                        folder = img["folder"]
+                        # Duplicates share a file path, so skip them before they overwrite the kept entry's file
+                        if (folder, image_name) in seen_images:
+                            raise ValueError("duplicate of an earlier entry")
+                        seen_images.add((folder, image_name))
+                        img_b64 = img.get("image_data")
+                        if not isinstance(img_b64, str) or not img_b64.strip():
+                            raise ValueError("image_data is missing or not a base64 string")
+                        image_bytes = base64.b64decode(img_b64)
+                        download_allowed = int(img.get("download_allowed", 1))
+                        path = save_image_file(folder, image_name, image_bytes)
+                        image_rows.append((image_name, folder, path, download_allowed))
+                    except Exception as e:
+                        skipped["images"] += 1
+                        st.warning(f"Skipping malformed image entry #{idx} ({img.get('name')}): {e}")
+                for idx, s in enumerate(backup["surveys"]):
+                    try:
+                        folder = s["folder"]
+                        rating = int(s["rating"])
+                        feedback = s.get("feedback")
+                        timestamp = s["timestamp"]
+                        survey_rows.append((folder, rating, feedback, timestamp))
+                    except Exception as e:
+                        skipped["surveys"] += 1
+                        st.warning(f"Skipping malformed survey entry #{idx}: {e}")
+                # OR IGNORE drops rows that violate a constraint, which the per-row inserts used to
+                # skip one by one; rowcount tells us how many made it in
+                c.executemany("INSERT OR IGNORE INTO folders (folder, name, age, profession, category) VALUES (?, ?, ?, ?, ?)", folder_rows)
+                skipped["folders"] += len(folder_rows) - c.rowcount
+                c.executemany("INSERT OR IGNORE INTO images (name, folder, path, download_allowed) VALUES (?, ?, ?, ?)", image_rows)
+                skipped["images"] += len(image_rows) - c.rowcount
+                c.executemany("INSERT OR IGNORE INTO surveys (folder, rating, feedback, timestamp) VALUES (?, ?, ?, ?)", survey_rows)
+                skipped["surveys"] += len(survey_rows) - c.rowcount
             msg = f"Restore complete. Skipped: folders={skipped['folders']}, images={skipped['images']}, surveys={skipped['surveys']}."
             st.success(msg)
         except Exception as e:
-            conn.rollback()
             st.error(f"Failed to restore database: {e}")
-        finally:
-            conn.close()
     except Exception as e:
         st.error(f"Unexpected error while restoring backup: {e}")
 
+@st.cache_resource
+def _github_state():
+    """Process-wide GitHub state reused between backup commits (repo info, auth check, branch head)."""
+    return {"repo": _parse_github_repo_info(REPO_URL), "auth_ok": False, "branch": GITHUB_BRANCH,
+            "head": None, "tree": None, "pushed": None}
+
+@st.cache_resource
+def get_github_session():
+    """Pooled keep-alive session for the GitHub API, so backups don't pay a TLS handshake per call."""
+    session = requests.Session()
+    session.headers.update({
+        "Authorization": f"token {GITHUB_TOKEN}",
+        "Accept": "application/vnd.github.v3+json",
+        "User-Agent": "Streamlit-Dristee1-App"
+    })
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=None)
+    session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=retry))
+    return session
+
+_REPORT_LEVELS = {"error": logging.ERROR, "warning": logging.WARNING, "info": logging.INFO, "success": logging.INFO}
+
+def _report(kind, message):
+    """Log a backup message, and also show it in the page when called from a script run."""
+    logger.log(_REPORT_LEVELS[kind], message)
+    # The background flusher has no script run context, where st.* output would be dropped
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        getattr(st, kind)(message)
+
+def file_to_base64(path):
+    """Return a file's contents as base64 text, encoding straight from a read-only memory map."""
+    with open(path, "rb") as f:
+        # mmap refuses zero-length files, and an empty file encodes to nothing anyway
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return base64.b64encode(mapped).decode('ascii')
+
+def _load_branch_head(session, api, state):
+    """Look up the backup branch, its head commit and tree, and which image files it holds."""
+    if state["branch"] is None:
+        response = session.get(api)
+        if response.status_code != 200:
+            _report("error", f"Failed to look up the repository: {response.status_code} {response.reason}. Response: {response.text}")
+            return False
+        state["branch"] = response.json()["default_branch"]
+    response = session.get(f"{api}/git/ref/heads/{state['branch']}")
+    if response.status_code != 200:
+        _report("error", f"Failed to read branch {state['branch']}: {response.status_code} {response.reason}. Response: {response.text}")
+        return False
+    head = response.json()["object"]["sha"]
+    response = session.get(f"{api}/git/commits/{head}")
+    if response.status_code != 200:
+        _report("error", f"Failed to read commit {head}: {response.status_code} {response.reason}. Response: {response.text}")
+        return False
+    tree = response.json()["tree"]["sha"]
+    response = session.get(f"{api}/git/trees/{tree}?recursive=1")
+    if response.status_code != 200:
+        _report("error", f"Failed to list repository files: {response.status_code} {response.reason}. Response: {response.text}")
+        return False
+    state["head"], state["tree"] = head, tree
+    state["pushed"] = {t["path"] for t in response.json().get("tree", [])
+                       if t["type"] == "blob" and t["path"].startswith(f"{IMAGE_DIR}/")}
+    return True
+
+def _commit_backup_tree(session, api, state, content_b64):
+    """Commit db_backup.db, new image files and removals of deleted ones as a single commit."""
+    blob_shas = {}
+
+    def blob(path, content):
+        # Blobs are content-addressed, so one made before a lost ref race is reused on the retry
+        if path not in blob_shas:
+            response = session.post(f"{api}/git/blobs", json={"content": content, "encoding": "base64"})
+            if response.status_code != 201:
+                _report("error", f"Failed to upload {path}: {response.status_code} {response.reason}. Response: {response.text}")
+                return None
+            blob_shas[path] = response.json()["sha"]
+        return blob_shas[path]
+
+    # Read the image list from the snapshot being committed, not the live database: it must match
+    # the db_backup.db in this commit, and a private connection never sees another writer's open
+    # transaction on the shared one
+    snapshot = sqlite3.connect(BACKUP_PATH)
+    try:
+        local = {r[0] for r in snapshot.execute("SELECT path FROM images").fetchall()}
+    finally:
+        snapshot.close()
+    for attempt in range(2):
+        if state["head"] is None and not _load_branch_head(session, api, state):
+            return False
+        # Rows whose file is missing locally keep their remote copy, which may be the only one left
+        added = sorted(p for p in local - state["pushed"] if os.path.exists(p))
+        removed = sorted(state["pushed"] - local)
+        entries = []
+        for path, content in [(BACKUP_PATH, content_b64)] + [(p, None) for p in added]:
+            sha = blob(path, content if content is not None else file_to_base64(path))
+            if sha is None:
+                return False
+            entries.append({"path": path, "mode": "100644", "type": "blob", "sha": sha})
+        # A null sha deletes the path from the base tree
+        entries += [{"path": p, "mode": "100644", "type": "blob", "sha": None} for p in removed]
+        response = session.post(f"{api}/git/trees", json={"base_tree": state["tree"], "tree": entries})
+        if response.status_code != 201:
+            _report("error", f"Failed to build the backup tree: {response.status_code} {response.reason}. Response: {response.text}")
+            return False
+        tree = response.json()["sha"]
+        message = f"Update db_backup.db {datetime.now().isoformat()}"
+        if added or removed:
+            message += f" (+{len(added)} / -{len(removed)} images)"
+        response = session.post(f"{api}/git/commits", json={"message": message, "tree": tree, "parents": [state["head"]]})
+        if response.status_code != 201:
+            _report("error", f"Failed to create the backup commit: {response.status_code} {response.reason}. Response: {response.text}")
+            return False
+        commit = response.json()["sha"]
+        # Not forced: if the branch moved since we read it, re-read the head and rebuild on top of it
+        response = session.patch(f"{api}/git/refs/heads/{state['branch']}", json={"sha": commit})
+        if response.status_code == 422 and attempt == 0:
+            state["head"] = None
+            continue
+        if response.status_code != 200:
+            _report("error", f"Failed to update branch {state['branch']}: {response.status_code} {response.reason}. Response: {response.text}")
+            state["head"] = None
+            return False
+        state["head"], state["tree"] = commit, tree
+        state["pushed"] = (state["pushed"] | set(added)) - set(removed)
+        _report("success", f"Successfully committed {BACKUP_PATH} to GitHub! Commit SHA: {commit}")
+        return True
+    return False
+
 def commit_backup_api():
-    """Commit db_backup.json to GitHub using the GitHub API."""
+    """Commit db_backup.db and its image files to GitHub using the Git Data API; returns whether it succeeded."""
     if not GITHUB_TOKEN:
-        st.error("GITHUB_TOKEN is not set. Please add it to .env or Streamlit secrets. Download db_backup.json manually.")
-        return
+        _report("error", "GITHUB_TOKEN is not set. Please add it to .env or Streamlit secrets. Download db_backup.db manually.")
+        return False
     if not GITHUB_TOKEN.startswith(("ghp_", "github_pat_")):
-        st.error("GITHUB_TOKEN is invalid (must start with 'ghp_' or 'github_pat_'). Regenerate at https://github.com/settings/tokens.")
-        return
+        _report("error", "GITHUB_TOKEN is invalid (must start with 'ghp_' or 'github_pat_'). Regenerate at https://github.com/settings/tokens.")
+        return False
     if not REPO_URL:
-        st.error("REPO_URL is not set. Please add it to .env or Streamlit secrets.")
-        return
+        _report("error", "REPO_URL is not set. Please add it to .env or Streamlit secrets.")
+        return False
     if not os.path.exists(BACKUP_PATH):
-        st.warning(f"{BACKUP_PATH} does not exist. Initialize the database by adding folders or images.")
-        return
+        _report("warning", f"{BACKUP_PATH} does not exist. Initialize the database by adding folders or images.")
+        return False
     try:
-        owner, repo = _parse_github_repo_info(REPO_URL)
+        state = _github_state()
+        owner, repo = state["repo"]
         if not owner or not repo:
-            st.error(f"Invalid REPO_URL: {REPO_URL}. Must be like 'https://github.com/owner/repo.git'.")
-            return
-        with open(BACKUP_PATH, "r", encoding="utf-8") as f:
-            content = f.read()
-        if not content.strip():
-            st.warning("db_backup.json is empty. Add folders or images to populate the database.")
-            return
-        content_b64 = base64.b64encode(content.encode('utf-8')).decode('utf-8')
-        headers = {
-            "Authorization": f"token {GITHUB_TOKEN}",
-            "Accept": "application/vnd.github.v3+json",
-            "User-Agent": "Streamlit-Dristee1-App"
-        }
-        auth_test = requests.get("https://api.github.com/user", headers=headers)
-        if auth_test.status_code != 200:
-            if auth_test.status_code == 401:
-                st.error("Authentication failed: Invalid or expired GITHUB_TOKEN. Regenerate with 'Contents: Read and write' permission at https://github.com/settings/tokens.")
-            elif auth_test.status_code == 403:
-                st.error("Authentication failed: Token lacks permissions for coffeecode19345/dristee1 or rate limit exceeded. Ensure 'Contents: Read and write' is enabled.")
-                st.error("Check rate limit: curl -H 'Authorization: token <GITHUB_TOKEN>' https://api.github.com/rate_limit")
-            else:
-                st.error(f"Authentication failed: {auth_test.status_code} {auth_test.reason}. Response: {auth_test.text}")
-            return
-        st.info(f"Authenticated as GitHub user: {auth_test.json().get('login')}")
-        sha = None
-        response = requests.get(
-            f"https://api.github.com/repos/{owner}/{repo}/contents/{BACKUP_PATH}",
-            headers=headers
-        )
-        if response.status_code == 200:
-            sha = response.json().get("sha")
-        elif response.status_code == 404:
-            st.info(f"{BACKUP_PATH} does not exist in repository. Creating new file.")
-        else:
-            st.error(f"Failed to check {BACKUP_PATH}: {response.status_code} {response.reason}. Response: {response.text}")
-            return
-        payload = {
-            "message": f"Update db_backup.json {datetime.now().isoformat()}",
-            "content": content_b64,
-            "branch": "main"
-        }
-        if sha:
-            payload["sha"] = sha
-        response = requests.put(
-            f"https://api.github.com/repos/{owner}/{repo}/contents/{BACKUP_PATH}",
-            headers=headers,
-            json=payload
-        )
-        if response.status_code in (200, 201):
-            st.success(f"Successfully committed {BACKUP_PATH} to GitHub! Commit SHA: {response.json().get('commit', {}).get('sha')}")
-        else:
-            st.error(f"Failed to commit {BACKUP_PATH}: {response.status_code} {response.reason}. Response: {response.text}")
-            if response.status_code == 403:
-                st.error("Check token permissions or rate limits. Run: curl -H 'Authorization: token <GITHUB_TOKEN>' https://api.github.com/rate_limit")
+            _report("error", f"Invalid REPO_URL: {REPO_URL}. Must be like 'https://github.com/owner/repo.git'.")
+            return False
+        content_b64 = file_to_base64(BACKUP_PATH)
+        if not content_b64:
+            _report("warning", "db_backup.db is empty. Add folders or images to populate the database.")
+            return False
+        session = get_github_session()
+        # The token only needs validating once per process, not before every backup
+        if not state["auth_ok"]:
+            auth_test = session.get("https://api.github.com/user")
+            if auth_test.status_code != 200:
+                if auth_test.status_code == 401:
+                    _report("error", "Authentication failed: Invalid or expired GITHUB_TOKEN. Regenerate with 'Contents: Read and write' permission at https://github.com/settings/tokens.")
+                elif auth_test.status_code == 403:
+                    _report("error", "Authentication failed: Token lacks permissions for coffeecode19345/dristee1 or rate limit exceeded. Ensure 'Contents: Read and write' is enabled.")
+                    _report("error", "Check rate limit: curl -H 'Authorization: token <GITHUB_TOKEN>' https://api.github.com/rate_limit")
+                else:
+                    _report("error", f"Authentication failed: {auth_test.status_code} {auth_test.reason}. Response: {auth_test.text}")
+                return False
+            _report("info", f"Authenticated as GitHub user: {auth_test.json().get('login')}")
+            state["auth_ok"] = True
+        # One commit carries the snapshot together with the image files it references, so the
+        # repository never holds a database pointing at missing files
+        return _commit_backup_tree(session, f"https://api.github.com/repos/{owner}/{repo}", state, content_b64)
     except Exception as e:
-        st.error(f"Unexpected error during GitHub commit: {str(e)}")
-        if "response" in locals():
-            st.error(f"Response: {response.text}")
+        _report("error", f"Unexpected error during GitHub commit: {str(e)}")
+        # The cached head may be half-updated; re-read it on the next attempt
+        _github_state()["head"] = None
+        return False
 
 def commit_backup():
-    """Commit db_backup.json to GitHub repository using GitPython (fallback)."""
+    """Commit db_backup.db to GitHub repository using GitPython (fallback)."""
     if not GITHUB_TOKEN:
-        st.error("GITHUB_TOKEN is not set. Please add it to .env or Streamlit secrets. Download db_backup.json manually.")
+        st.error("GITHUB_TOKEN is not set. Please add it to .env or Streamlit secrets. Download db_backup.db manually.")
         return
     try:
         repo = git.Repo(".")
         repo.config_writer().set_value("user", "name", "Streamlit App").release()
         repo.config_writer().set_value("user", "email", "streamlit@app.com").release()
-        repo.index.add([BACKUP_PATH])
-        repo.index.commit("Update db_backup.json")
+        repo.index.add([BACKUP_PATH] + ([IMAGE_DIR] if os.path.isdir(IMAGE_DIR) else []))
+        repo.index.commit("Update db_backup.db")
         origin = repo.remote(name="origin")
         origin.set_url(f"https://{GITHUB_TOKEN}@{REPO_URL.replace('https://', '')}")
         origin.push()
-        st.success("Successfully committed db_backup.json to GitHub!")
+        st.success("Successfully committed db_backup.db to GitHub!")
     except Exception as e:
         st.error(f"Failed to commit backup to GitHub: {str(e)}")
 
 # -------------------------------
 # Helper Functions
 # -------------------------------
-def image_to_base64(image_data):
-    """Convert image data (bytes) to base64 string."""
-    return base64.b64encode(image_data).decode('utf-8') if isinstance(image_data, bytes) else image_data.encode('utf-8')
-
 def generate_thumbnail(image, size=(100, 100)):
-    """Generate a thumbnail for an image."""
+    """Generate JPEG thumbnail bytes for an image."""
     img = image.copy()
     img.thumbnail(size)
-    return img
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=75)
+    return output.getvalue()
+
+def save_image_file(folder, name, image_data):
+    """Write image bytes under IMAGE_DIR and return the stored path."""
+    path = os.path.join(IMAGE_DIR, folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write beside the target and rename so readers never see a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(image_data)
+    os.replace(tmp_path, path)
+    return path
+
+def remove_image_files(paths):
+    """Remove image files that no longer have a database row."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+@st.cache_resource
+def check_jpeg_codec():
+    """Log once per process when Pillow's JPEG codec is not libjpeg-turbo."""
+    if not features.check("libjpeg_turbo"):
+        logger.warning(
+            "Pillow is not linked against libjpeg-turbo; JPEG encoding will use the scalar DCT. "
+            "Install a Pillow wheel built with libjpeg-turbo to speed up uploads.")
+
+@st.cache_resource
+def freeze_startup_objects():
+    """Move everything allocated during startup out of the garbage collector's reach, once per process."""
+    # Disabling GC outright would leak cyclic garbage in a long-lived multi-session server;
+    # freezing keeps collection on but stops every full pass from rescanning the startup heap
+    gc.collect()
+    gc.freeze()
 
 def validate_folder_name(folder):
     """Validate folder name: alphanumeric, underscores, lowercase, 3-20 characters."""
-    pattern = r"^[a-z0-9_]{3,20}$"
-    return bool(re.match(pattern, folder))
+    return bool(_FOLDER_NAME_RE.match(folder))
 
+@st.cache_resource
 def init_db():
     """Initialize SQLite database and restore from backup if available."""
     restore_db()
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS folders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            folder TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            age INTEGER NOT NULL,
-            profession TEXT NOT NULL,
-            category TEXT NOT NULL
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS images (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            folder TEXT NOT NULL,
-            image_data BLOB NOT NULL,
-            download_allowed BOOLEAN NOT NULL DEFAULT 1,
-            FOREIGN KEY(folder) REFERENCES folders(folder)
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS surveys (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            folder TEXT NOT NULL,
-            rating INTEGER NOT NULL,
-            feedback TEXT,
-            timestamp TEXT NOT NULL,
-            FOREIGN KEY(folder) REFERENCES folders(folder)
-        )
-    """)
-    default_folders = [
-        {"name": "Sarika", "age": 28, "profession": "Photographer", "category": "Artists", "folder": "sarika"},
-        {"name": "Jamuna", "age": 32, "profession": "Sculptor", "category": "Artists", "folder": "jamuna"},
-    ]
-    for folder_data in default_folders:
-        c.execute("SELECT COUNT(*) FROM folders WHERE folder = ?", (folder_data["folder"],))
-        if c.fetchone()[0] == 0:
-            c.execute("""
-                INSERT INTO folders (folder, name, age, profession, category)
-                VALUES (?, ?, ?, ?, ?)
-            """, (folder_data["folder"], folder_data["name"], folder_data["age"],
-                  folder_data["profession"], folder_data["category"]))
-    conn.commit()
-    conn.close()
-    save_backup()
+    # WAL is persistent in the database file, so setting it once here covers every connection
+    get_conn().execute("PRAGMA journal_mode=WAL")
+    with write_transaction() as c:
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS folders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                folder TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL,
+                age INTEGER NOT NULL,
+                profession TEXT NOT NULL,
+                category TEXT NOT NULL
+            )
+        """)
+        # Full-text index over the searchable folder columns, kept in sync by triggers
+        fts_exists = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'folders_fts'").fetchone()
+        c.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS folders_fts
+            USING fts5(folder, name, profession, category, content='folders', content_rowid='id')
+        """)
+        if not fts_exists:
+            c.execute("INSERT INTO folders_fts(folders_fts) VALUES ('rebuild')")
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS folders_fts_ai AFTER INSERT ON folders BEGIN
+                INSERT INTO folders_fts(rowid, folder, name, profession, category)
+                VALUES (new.id, new.folder, new.name, new.profession, new.category);
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS folders_fts_ad AFTER DELETE ON folders BEGIN
+                INSERT INTO folders_fts(folders_fts, rowid, folder, name, profession, category)
+                VALUES ('delete', old.id, old.folder, old.name, old.profession, old.category);
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS folders_fts_au AFTER UPDATE ON folders BEGIN
+                INSERT INTO folders_fts(folders_fts, rowid, folder, name, profession, category)
+                VALUES ('delete', old.id, old.folder, old.name, old.profession, old.category);
+                INSERT INTO folders_fts(rowid, folder, name, profession, category)
+                VALUES (new.id, new.folder, new.name, new.profession, new.category);
+            END
+        """)
+        # Older databases (and snapshots) keep image BLOBs in the table; set that one aside to migrate it
+        legacy_cols = [col[1] for col in c.execute("PRAGMA table_info(images)").fetchall()]
+        if "image_data" in legacy_cols:
+            c.execute("DROP INDEX IF EXISTS idx_images_folder_name")
+            c.execute("ALTER TABLE images RENAME TO images_blob")
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                path TEXT NOT NULL,
+                download_allowed BOOLEAN NOT NULL DEFAULT 1,
+                thumb BLOB,
+                FOREIGN KEY(folder) REFERENCES folders(folder)
+            )
+        """)
+        if "image_data" in legacy_cols:
+            thumb_col = "thumb" if "thumb" in legacy_cols else "NULL"
+            rows = c.execute(f"SELECT id, name, folder, image_data, download_allowed, {thumb_col} FROM images_blob").fetchall()
+            c.executemany(
+                "INSERT INTO images (id, name, folder, path, download_allowed, thumb) VALUES (?, ?, ?, ?, ?, ?)",
+                [(image_id, name, folder, save_image_file(folder, name, data), download, thumb)
+                 for image_id, name, folder, data, download, thumb in rows]
+            )
+            c.execute("DROP TABLE images_blob")
+        # One-shot backfill for rows stored before thumbnails were precomputed
+        backfill = []
+        for image_id, path in c.execute("SELECT id, path FROM images WHERE thumb IS NULL").fetchall():
+            try:
+                backfill.append((generate_thumbnail(Image.open(path)), image_id))
+            except Exception as e:
+                logger.warning("Could not generate thumbnail for image %s: %s", image_id, e)
+        c.executemany("UPDATE images SET thumb = ? WHERE id = ?", backfill)
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_images_folder_name ON images(folder, name)")
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS surveys (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                folder TEXT NOT NULL,
+                rating INTEGER NOT NULL,
+                feedback TEXT,
+                timestamp TEXT NOT NULL,
+                FOREIGN KEY(folder) REFERENCES folders(folder)
+            )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_surveys_folder_ts ON surveys(folder, timestamp)")
+        default_folders = [
+            {"name": "Sarika", "age": 28, "profession": "Photographer", "category": "Artists", "folder": "sarika"},
+            {"name": "Jamuna", "age": 32, "profession": "Sculptor", "category": "Artists", "folder": "jamuna"},
+        ]
+        c.executemany("""
+            INSERT OR IGNORE INTO folders (folder, name, age, profession, category)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(d["folder"], d["name"], d["age"], d["profession"], d["category"]) for d in default_folders])
+        changed = c.rowcount > 0 or "image_data" in legacy_cols or bool(backfill)
+    # Only a schema migration or the first seed changes anything worth backing up
+    if changed:
+        save_backup()
 
 def load_folders(search_query=""):
     """Load folders from database, optionally filtered by search query."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    query = "SELECT folder, name, age, profession, category FROM folders WHERE name LIKE ? OR folder LIKE ? OR profession LIKE ? OR category LIKE ?"
-    c.execute(query, (f"%{search_query}%", f"%{search_query}%", f"%{search_query}%", f"%{search_query}%"))
-    folders = [{"folder": r[0], "name": r[1], "age": r[2], "profession": r[3], "category": r[4]} for r in c.fetchall()]
-    conn.close()
-    return folders
+    return _load_folders_cached(search_query, _data_versions().get("folders", 0))
+
+@st.cache_data(show_spinner=False)
+def _load_folders_cached(search_query, version):
+    """Cached body of load_folders; version changes whenever a folder is added."""
+    c = get_conn().cursor()
+    # sqlite3.Row names the columns in C, so each row converts straight to a dict
+    c.row_factory = sqlite3.Row
+    query = "SELECT folder, name, age, profession, category FROM folders"
+    if search_query.strip():
+        # Quote each word as an FTS5 prefix term so user input can never break the MATCH syntax
+        terms = _SEARCH_TERM_RE.findall(search_query)
+        if not terms:
+            return []
+        c.execute(query + " WHERE id IN (SELECT rowid FROM folders_fts WHERE folders_fts MATCH ?)",
+                  (" ".join(f'"{t}"*' for t in terms),))
+    else:
+        c.execute(query)
+    return [dict(r) for r in c.fetchall()]
 
 def add_folder(folder, name, age, profession, category):
     """Add a new folder to the database with validation."""
@@ -364,14 +708,12 @@ def add_folder(folder, name, age, profession, category):
         st.error("Folder name must be 3-20 characters, lowercase alphanumeric or underscores.")
         return False
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO folders (folder, name, age, profession, category)
-            VALUES (?, ?, ?, ?, ?)
-        """, (folder, name, age, profession, category))
-        conn.commit()
-        conn.close()
+        with get_write_lock():
+            get_conn().execute("""
+                INSERT INTO folders (folder, name, age, profession, category)
+                VALUES (?, ?, ?, ?, ?)
+            """, (folder, name, age, profession, category))
+        _bump_version("folders")
         save_backup()
         return True
     except sqlite3.IntegrityError:
@@ -381,42 +723,51 @@ def add_folder(folder, name, age, profession, category):
         st.error(f"Error adding folder: {str(e)}")
         return False
 
+def _encode_upload(uploaded_file):
+    """Compress an uploaded image to an 800px JPEG and return (image_data, thumb)."""
+    img = Image.open(uploaded_file)
+    img = img.convert("RGB")
+    # BILINEAR is plenty for a 800px display copy and much cheaper than the LANCZOS default
+    img.thumbnail((800, 800), Image.Resampling.BILINEAR)
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=85, optimize=False, progressive=False)
+    return output.getvalue(), generate_thumbnail(img)
+
 def load_images_to_db(uploaded_files, folder, download_allowed=True):
-    """Load images into the database with compression."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    for uploaded_file in uploaded_files:
-        img = Image.open(uploaded_file)
-        img = img.convert("RGB")
-        img.thumbnail((800, 800))
-        output = io.BytesIO()
-        img.save(output, format="JPEG", quality=85)
-        image_data = output.getvalue()
-        extension = ".jpg"
-        random_filename = f"{uuid.uuid4()}{extension}"
-        c.execute("SELECT COUNT(*) FROM images WHERE folder = ? AND name = ?", (folder, random_filename))
-        if c.fetchone()[0] == 0:
-            c.execute("INSERT INTO images (name, folder, image_data, download_allowed) VALUES (?, ?, ?, ?)",
-                      (random_filename, folder, image_data, download_allowed))
-    conn.commit()
-    conn.close()
+    """Load images into the database with compression, in a single transaction."""
+    # PIL releases the GIL while decoding, resizing and encoding, so uploads compress in parallel
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        encoded = list(executor.map(_encode_upload, uploaded_files))
+    rows = []
+    try:
+        for image_data, thumb in encoded:
+            extension = ".jpg"
+            random_filename = f"{uuid.uuid4()}{extension}"
+            path = save_image_file(folder, random_filename, image_data)
+            rows.append((random_filename, folder, path, download_allowed, thumb))
+        with write_transaction() as c:
+            # UNIQUE(folder, name) turns dedup into an index probe instead of a SELECT per file
+            c.executemany("INSERT OR IGNORE INTO images (name, folder, path, download_allowed, thumb) VALUES (?, ?, ?, ?, ?)", rows)
+    except Exception:
+        remove_image_files([row[2] for row in rows])
+        raise
+    _bump_version(folder)
     save_backup()
 
 def swap_image(folder, old_image_name, new_image_file):
     """Replace an existing image with a new uploaded image."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        img = Image.open(new_image_file)
-        img = img.convert("RGB")
-        img.thumbnail((800, 800))
-        output = io.BytesIO()
-        img.save(output, format="JPEG", quality=85)
-        new_image_data = output.getvalue()
-        c.execute("UPDATE images SET image_data = ? WHERE folder = ? AND name = ?",
-                  (new_image_data, folder, old_image_name))
-        conn.commit()
-        conn.close()
+        new_image_data, new_thumb = _encode_upload(new_image_file)
+        # A fresh file name keeps image files write-once, which the GitHub upload relies on
+        new_path = save_image_file(folder, f"{uuid.uuid4()}.jpg", new_image_data)
+        with get_write_lock():
+            conn = get_conn()
+            old_path = conn.execute("SELECT path FROM images WHERE folder = ? AND name = ?", (folder, old_image_name)).fetchone()
+            conn.execute("UPDATE images SET path = ?, thumb = ? WHERE folder = ? AND name = ?",
+                         (new_path, new_thumb, folder, old_image_name))
+        if old_path:
+            remove_image_files([old_path[0]])
+        _bump_version(folder)
         save_backup()
         return True
     except Exception as e:
@@ -425,119 +776,262 @@ def swap_image(folder, old_image_name, new_image_file):
 
 def update_download_permission(folder, image_name, download_allowed):
     """Update download permission for an image."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE images SET download_allowed = ? WHERE folder = ? AND name = ?",
-              (download_allowed, folder, image_name))
-    conn.commit()
-    conn.close()
+    with get_write_lock():
+        get_conn().execute("UPDATE images SET download_allowed = ? WHERE folder = ? AND name = ?",
+                           (download_allowed, folder, image_name))
+    _bump_version(folder)
     save_backup()
 
 def delete_image(folder, name):
-    """Delete an image from the database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM images WHERE folder = ? AND name = ?", (folder, name))
-    conn.commit()
-    conn.close()
+    """Delete an image from the database and remove its file."""
+    with get_write_lock():
+        conn = get_conn()
+        row = conn.execute("SELECT path FROM images WHERE folder = ? AND name = ?", (folder, name)).fetchone()
+        conn.execute("DELETE FROM images WHERE folder = ? AND name = ?", (folder, name))
+    if row:
+        remove_image_files([row[0]])
+    _bump_version(folder)
     save_backup()
 
 def load_survey_data():
     """Load survey data from database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT folder, rating, feedback, timestamp FROM surveys")
-    survey_data = {}
-    for row in c.fetchall():
-        folder, rating, feedback, timestamp = row
-        if folder not in survey_data:
-            survey_data[folder] = []
-        survey_data[folder].append({"rating": rating, "feedback": feedback, "timestamp": timestamp})
-    conn.close()
-    return survey_data
+    return _load_survey_data_cached(_data_versions().get("surveys", 0))
+
+@st.cache_data(show_spinner=False)
+def _load_survey_data_cached(version):
+    """Cached body of load_survey_data; version changes whenever a survey is saved or deleted."""
+    c = get_conn().cursor()
+    c.execute("SELECT id, folder, rating, feedback, timestamp FROM surveys")
+    survey_data = defaultdict(list)
+    for survey_id, folder, rating, feedback, timestamp in c:
+        survey_data[folder].append({"id": survey_id, "rating": rating, "feedback": feedback, "timestamp": timestamp})
+    return dict(survey_data)
+
+def load_folder_rating_stats():
+    """Load the (average rating, review count) per folder."""
+    return _load_folder_rating_stats_cached(_data_versions().get("surveys", 0))
+
+@st.cache_data(show_spinner=False)
+def _load_folder_rating_stats_cached(version):
+    """Cached body of load_folder_rating_stats; version changes whenever a survey is saved or deleted."""
+    c = get_conn().cursor()
+    # idx_surveys_folder_ts leads with folder, so the GROUP BY walks the index in order
+    c.execute("SELECT folder, AVG(rating), COUNT(*) FROM surveys GROUP BY folder")
+    return {folder: (avg, count) for folder, avg, count in c.fetchall()}
 
 def save_survey_data(folder, rating, feedback, timestamp):
     """Save survey data to database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO surveys (folder, rating, feedback, timestamp) VALUES (?, ?, ?, ?)",
-              (folder, rating, feedback, timestamp))
-    conn.commit()
-    conn.close()
+    with get_write_lock():
+        get_conn().execute("INSERT INTO surveys (folder, rating, feedback, timestamp) VALUES (?, ?, ?, ?)",
+                           (folder, rating, feedback, timestamp))
+    _bump_version("surveys")
     save_backup()
 
-def delete_survey_entry(folder, timestamp):
+def delete_survey_entry(folder, survey_id):
     """Delete a survey entry from database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM surveys WHERE folder = ? AND timestamp = ?", (folder, timestamp))
-    conn.commit()
-    conn.close()
+    with get_write_lock():
+        get_conn().execute("DELETE FROM surveys WHERE folder = ? AND id = ?", (folder, survey_id))
+    _bump_version("surveys")
     save_backup()
 
-def get_images(folder):
-    """Get images from database for a folder."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT name, image_data, download_allowed FROM images WHERE folder = ?", (folder,))
-    images = []
-    for r in c.fetchall():
-        name, data, download = r
+def get_image_names(folder):
+    """Get the names of a folder's images, in grid order."""
+    return _get_image_names_cached(folder, _data_versions().get(folder, 0))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _get_image_names_cached(folder, version):
+    """Cached body of get_image_names; version changes whenever the folder's images do."""
+    c = get_conn().cursor()
+    # Same rows and order as get_image_thumbnails so grid and zoom indexes line up
+    c.execute("SELECT name FROM images WHERE folder = ? AND thumb IS NOT NULL ORDER BY id", (folder,))
+    return [r[0] for r in c.fetchall()]
+
+def get_image(folder, name):
+    """Get the file path, download flag and MIME type of a single image, or None if it is gone."""
+    return _get_image_cached(folder, name, _data_versions().get(folder, 0))
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _get_image_cached(folder, name, version):
+    """Cached body of get_image; version changes whenever the folder's images do."""
+    c = get_conn().cursor()
+    c.execute("SELECT path, download_allowed FROM images WHERE folder = ? AND name = ?", (folder, name))
+    row = c.fetchone()
+    if row is None:
+        return None
+    path, download = row
+    mime = "image/jpeg" if name.lower().endswith(('.jpg', '.jpeg')) else "image/png"
+    return {"name": name, "path": path, "download": download, "mime": mime}
+
+def _read_image_files(paths):
+    """Read image files so the OS page cache holds them by the time st.image asks for them."""
+    for path in paths:
         try:
-            img = Image.open(io.BytesIO(data))
-            thumbnail = generate_thumbnail(img)
-            base64_image = image_to_base64(data)
-            images.append({
-                "name": name,
-                "image": img,
-                "thumbnail": thumbnail,
-                "data": data,
-                "download": download,
-                "base64": base64_image
-            })
-        except Exception as e:
-            st.error(f"Error loading image {name}: {str(e)}")
-    conn.close()
-    return images
+            with open(path, "rb") as f:
+                while f.read(1 << 20):
+                    pass
+        except OSError:
+            # Best effort only: the zoom view reports real errors when it shows the image
+            pass
+
+def prefetch_images(folder, names):
+    """Look up the given images now and read their files on a background thread."""
+    images = [get_image(folder, name) for name in names]
+    paths = [img["path"] for img in images if img is not None]
+    if paths:
+        threading.Thread(target=_read_image_files, args=(paths,), daemon=True).start()
 
-def display_rating_chart(survey_data, folders):
+def list_image_names(folder):
+    """Get (name, download_allowed) pairs for a folder without reading any image data."""
+    return _list_image_names_cached(folder, _data_versions().get(folder, 0))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _list_image_names_cached(folder, version):
+    """Cached body of list_image_names; version changes whenever the folder's images do."""
+    c = get_conn().cursor()
+    c.execute("SELECT name, download_allowed FROM images WHERE folder = ?", (folder,))
+    return c.fetchall()
+
+def get_image_thumbnails(folder):
+    """Get names, thumbnail bytes and download flags for a folder's grid view."""
+    return _get_image_thumbnails_cached(folder, _data_versions().get(folder, 0))
+
+# cache_resource hands every session the same list instead of unpickling a fresh copy of
+# all the thumbnail bytes on each rerun, as cache_data would; callers only read it
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _get_image_thumbnails_cached(folder, version):
+    """Cached body of get_image_thumbnails; version changes whenever the folder's images do."""
+    c = get_conn().cursor()
+    # Thumbnails are precomputed at upload time, so the grid never touches PIL; rows whose
+    # image could not be decoded have no thumb and are skipped, as get_image_names skips them
+    c.execute("SELECT name, thumb, download_allowed FROM images WHERE folder = ? AND thumb IS NOT NULL ORDER BY id", (folder,))
+    return tuple({"name": name, "thumbnail": thumb, "download": download} for name, thumb, download in c.fetchall())
+
+def display_rating_chart(rating_stats, folders):
     """Display a bar chart of average ratings per folder."""
     ratings = []
     folder_names = []
     for f in folders:
-        if f["folder"] in survey_data and survey_data[f["folder"]]:
-            avg_rating = sum(entry["rating"] for entry in survey_data[f["folder"]]) / len(survey_data[f["folder"]])
-            ratings.append(avg_rating)
+        if f["folder"] in rating_stats:
+            ratings.append(rating_stats[f["folder"]][0])
             folder_names.append(f["name"])
     if ratings:
         st.markdown("### Average Ratings per Folder")
-        chart_config = {
-            "type": "bar",
-            "data": {
-                "labels": folder_names,
-                "datasets": [{
-                    "label": "Average Rating",
-                    "data": ratings,
-                    "backgroundColor": ["#4CAF50", "#2196F3", "#FF9800", "#F44336", "#9C27B0"],
-                    "borderColor": ["#388E3C", "#1976D2", "#F57C00", "#D32F2F", "#7B1FA2"],
-                    "borderWidth": 1
-                }]
-            },
-            "options": {
-                "scales": {
-                    "y": {"beginAtZero": True, "max": 5, "title": {"display": True, "text": "Rating (1-5)"}},
-                    "x": {"title": {"display": True, "text": "Folder"}}
-                }
-            }
-        }
-        st.markdown("```chartjs\n" + str(chart_config) + "\n```", unsafe_allow_html=True)
+        # Streamlit has no Chart.js renderer (and str() of a dict isn't JSON), so use its native Vega-Lite chart
+        st.bar_chart(
+            {"Folder": folder_names, "Average Rating": ratings},
+            x="Folder", y="Average Rating", x_label="Folder", y_label="Rating (1-5)"
+        )
     else:
         st.info("No survey data available to display chart.")
 
+@st.fragment
+def survey_panel(f):
+    """Survey form and previous feedback for one folder; deleting a comment reruns only this panel."""
+    # Read inside the fragment so the fragment rerun after a delete picks up the new version
+    survey_data = load_survey_data()
+    rating_stats = load_folder_rating_stats()
+    with st.form(key=f"survey_form_{f['folder']}"):
+        rating = st.slider("Rating (1-5)", 1, 5, 3, key=f"rating_{f['folder']}")
+        feedback = st.text_area("Feedback", key=f"feedback_{f['folder']}")
+        if st.form_submit_button("Submit"):
+            timestamp = datetime.now().isoformat()
+            save_survey_data(f["folder"], rating, feedback, timestamp)
+            st.success("✅ Response recorded")
+            st.rerun()
+    if f["folder"] in survey_data and survey_data[f["folder"]]:
+        st.write("### 📊 Previous Feedback:")
+        avg_rating, review_count = rating_stats[f["folder"]]
+        st.markdown(f"**Average Rating:** ⭐ {avg_rating:.1f} ({review_count} reviews)")
+        # Feedback is user input rendered as HTML, so escape it
+        entry_md = [
+            f"- {'⭐' * entry['rating']} — {html.escape(entry['feedback'] or '')}  \n"
+            f"<sub>🕒 {entry['timestamp']}</sub>"
+            for entry in survey_data[f["folder"]]
+        ]
+        if not st.session_state.is_author:
+            # Viewers need no delete buttons, so the whole list is a single markdown element
+            st.markdown("\n".join(entry_md), unsafe_allow_html=True)
+        else:
+            # Keyed on the row id: a click is delivered to the next run by key, and positions
+            # shift whenever another session adds or removes a comment in between
+            for entry, md in zip(survey_data[f["folder"]], entry_md):
+                cols = st.columns([6, 1])
+                with cols[0]:
+                    st.markdown(md, unsafe_allow_html=True)
+                with cols[1]:
+                    if st.button("🗑️", key=f"ds_{entry['id']}"):
+                        delete_survey_entry(f["folder"], entry["id"])
+                        st.toast("Deleted comment.", icon="🗑️")
+                        st.rerun(scope="fragment")
+    else:
+        st.info("No feedback yet — be the first to leave a comment!")
+
+def shift_zoom(step):
+    """Move the zoom view to a neighbouring image."""
+    st.session_state.zoom_index += step
+
+@st.fragment
+def zoom_view(folder):
+    """Show one image of a folder with navigation; Prev/Next rerun only this fragment."""
+    # Only the shown image is looked up; the rest of the folder is just a list of names
+    names = get_image_names(folder)
+    if not names:
+        # The folder was emptied elsewhere: nothing left to zoom into
+        st.session_state.zoom_folder = None
+        st.session_state.zoom_index = 0
+        st.rerun()
+    idx = st.session_state.zoom_index
+    if idx >= len(names):
+        idx = 0
+        st.session_state.zoom_index = 0
+    img_dict = get_image(folder, names[idx])
+    if img_dict is None:
+        # The row is gone but the cached name list still has it; refresh the list and start over
+        _bump_version(folder)
+        st.session_state.zoom_index = 0
+        st.rerun()
+    st.subheader(f"🔍 Viewing {folder} ({idx+1}/{len(names)})")
+    # media/ is not part of the backup, so a row can outlive its file; say so instead of crashing
+    file_present = os.path.exists(img_dict["path"])
+    if file_present:
+        st.image(img_dict["path"], use_container_width=True)
+    else:
+        st.warning(f"Image file for {img_dict['name']} is missing.")
+    col1, col2, col3 = st.columns([1, 8, 1])
+    # A click inside a fragment already reruns just the fragment, so the callbacks need no st.rerun
+    with col1:
+        if idx > 0:
+            st.button("◄ Previous", key=f"prev_{folder}", on_click=shift_zoom, args=(-1,))
+    with col3:
+        if idx < len(names) - 1:
+            st.button("Next ►", key=f"next_{folder}", on_click=shift_zoom, args=(1,))
+    if img_dict["download"] and file_present:
+        with open(img_dict["path"], "rb") as f:
+            st.download_button("⬇️ Download", data=f, file_name=img_dict["name"], mime=img_dict["mime"])
+    # Deleting and leaving change what the rest of the page shows, so they rerun the whole app
+    if st.session_state.is_author:
+        if st.button("🗑️ Delete Image", key=f"delete_{folder}"):
+            delete_image(folder, img_dict["name"])
+            st.toast("Deleted.", icon="🗑️")
+            st.session_state.zoom_index = max(0, idx - 1)
+            if not get_image_names(folder):
+                st.session_state.zoom_folder = None
+                st.session_state.zoom_index = 0
+            st.rerun()
+    if st.button("⬅️ Back to Grid", key=f"back_{folder}"):
+        st.session_state.zoom_folder = None
+        st.session_state.zoom_index = 0
+        st.rerun()
+    # Warm the neighbours while the user looks at this one, so Prev/Next hit warm caches
+    prefetch_images(folder, names[max(0, idx - 1):idx] + names[idx + 1:idx + 2])
+
 # -------------------------------
 # Initialize DB & Session State
 # -------------------------------
 init_db()
+start_backup_flusher()
+check_jpeg_codec()
+freeze_startup_objects()
 if "zoom_folder" not in st.session_state:
     st.session_state.zoom_folder = None
 if "zoom_index" not in st.session_state:
@@ -581,7 +1075,8 @@ with st.sidebar:
                     st.error("Please fill in all fields.")
         st.subheader("Upload Images")
         data = load_folders()
-        folder_choice = st.selectbox("Select Folder", [item["folder"] for item in data], key="upload_folder")
+        folder_names = [item["folder"] for item in data]
+        folder_choice = st.selectbox("Select Folder", folder_names, key="upload_folder")
         download_allowed = st.checkbox("Allow Downloads for New Images", value=True)
         uploaded_files = st.file_uploader(
             "Upload Images", accept_multiple_files=True, type=['jpg', 'jpeg', 'png'], key="upload_files"
@@ -591,10 +1086,10 @@ with st.sidebar:
             st.success(f"{len(uploaded_files)} image(s) uploaded to '{folder_choice}'!")
             st.rerun()
         st.subheader("Image Swap")
-        folder_choice_swap = st.selectbox("Select Folder for Image Swap", [item["folder"] for item in data], key="swap_folder")
-        images = get_images(folder_choice_swap)
-        if images:
-            image_choice = st.selectbox("Select Image to Swap", [img["name"] for img in images], key="swap_image")
+        folder_choice_swap = st.selectbox("Select Folder for Image Swap", folder_names, key="swap_folder")
+        image_names = list_image_names(folder_choice_swap)
+        if image_names:
+            image_choice = st.selectbox("Select Image to Swap", [name for name, _ in image_names], key="swap_image")
             new_image = st.file_uploader("Upload New Image", type=['jpg', 'jpeg', 'png'], key="swap_upload")
             if st.button("Swap Image") and new_image:
                 if swap_image(folder_choice_swap, image_choice, new_image):
@@ -603,32 +1098,34 @@ with st.sidebar:
                 else:
                     st.error("Failed to swap image.")
         st.subheader("Download Permissions")
-        folder_choice_perm = st.selectbox("Select Folder for Download Settings", [item["folder"] for item in data], key=f"download_folder_{uuid.uuid4()}")
-        images = get_images(folder_choice_perm)
-        if images:
+        folder_choice_perm = st.selectbox("Select Folder for Download Settings", folder_names, key="download_folder_perm")
+        image_names = list_image_names(folder_choice_perm)
+        if image_names:
             with st.form(key=f"download_permissions_form_{folder_choice_perm}"):
                 st.write("Toggle Download Permissions:")
                 download_states = {}
-                for img_dict in images:
-                    toggle_key = f"download_toggle_{folder_choice_perm}_{img_dict['name']}"
-                    download_states[img_dict['name']] = st.checkbox(
-                        f"Allow download for {img_dict['name'][:8]}...{img_dict['name'][-4:]}",
-                        value=img_dict["download"],
+                for name, download in image_names:
+                    toggle_key = f"download_toggle_{folder_choice_perm}_{name}"
+                    download_states[name] = st.checkbox(
+                        f"Allow download for {name[:8]}...{name[-4:]}",
+                        value=download,
                         key=toggle_key
                     )
                 if st.form_submit_button("Apply Download Permissions"):
-                    for img_dict in images:
-                        if download_states[img_dict['name']] != img_dict["download"]:
-                            update_download_permission(folder_choice_perm, img_dict["name"], download_states[img_dict['name']])
+                    for name, download in image_names:
+                        if download_states[name] != download:
+                            update_download_permission(folder_choice_perm, name, download_states[name])
                     st.success("Download permissions updated!")
                     st.rerun()
+        if st.button("Flush backup now"):
+            flush_backup(force=True)
         if os.path.exists(BACKUP_PATH):
             with open(BACKUP_PATH, "rb") as f:
                 st.download_button(
-                    label="Download db_backup.json",
+                    label="Download db_backup.db",
                     data=f,
-                    file_name="db_backup.json",
-                    mime="application/json"
+                    file_name="db_backup.db",
+                    mime="application/vnd.sqlite3"
                 )
 
 # -------------------------------
@@ -649,8 +1146,7 @@ img {border-radius:4px; pointer-events: none; user-select: none;}
 st.title("📸 Interactive Photo Gallery & Survey")
 search_query = st.text_input("Search by name, folder, profession, or category")
 data = load_folders(search_query)
-survey_data = load_survey_data()
-display_rating_chart(survey_data, data)
+display_rating_chart(load_folder_rating_stats(), data)
 categories = sorted(set(item["category"] for item in data))
 tabs = st.tabs(categories)
 
@@ -665,7 +1161,7 @@ if st.session_state.zoom_folder is None:
                     f'{f["name"]} ({f["age"]}, {f["profession"]})</div>',
                     unsafe_allow_html=True
                 )
-                images = get_images(f["folder"])
+                images = get_image_thumbnails(f["folder"])
                 if images:
                     cols = st.columns(4)
                     for idx, img_dict in enumerate(images):
@@ -678,70 +1174,8 @@ if st.session_state.zoom_folder is None:
                 else:
                     st.warning(f"No images found for {f['folder']}")
                 with st.expander(f"📝 Survey for {f['name']}"):
-                    with st.form(key=f"survey_form_{f['folder']}"):
-                        rating = st.slider("Rating (1-5)", 1, 5, 3, key=f"rating_{f['folder']}")
-                        feedback = st.text_area("Feedback", key=f"feedback_{f['folder']}")
-                        if st.form_submit_button("Submit"):
-                            timestamp = datetime.now().isoformat()
-                            save_survey_data(f["folder"], rating, feedback, timestamp)
-                            st.success("✅ Response recorded")
-                            st.rerun()
-                    if f["folder"] in survey_data and survey_data[f["folder"]]:
-                        st.write("### 📊 Previous Feedback:")
-                        ratings = [entry['rating'] for entry in survey_data[f["folder"]]]
-                        avg_rating = sum(ratings) / len(ratings)
-                        st.markdown(f"**Average Rating:** ⭐ {avg_rating:.1f} ({len(ratings)} reviews)")
-                        for entry in survey_data[f["folder"]]:
-                            cols = st.columns([6, 1])
-                            with cols[0]:
-                                rating_display = "⭐" * entry["rating"]
-                                st.markdown(
-                                    f"- {rating_display} — {entry['feedback']}  \n"
-                                    f"<sub>🕒 {entry['timestamp']}</sub>",
-                                    unsafe_allow_html=True
-                                )
-                            if st.session_state.is_author:
-                                with cols[1]:
-                                    if st.button("🗑️", key=f"delete_survey_{f['folder']}_{entry['timestamp']}"):
-                                        delete_survey_entry(f["folder"], entry["timestamp"])
-                                        st.success("Deleted comment.")
-                                        st.rerun()
-                    else:
-                        st.info("No feedback yet — be the first to leave a comment!")
+                    survey_panel(f)
 
 # Zoom View
 else:
-    folder = st.session_state.zoom_folder
-    images = get_images(folder)
-    idx = st.session_state.zoom_index
-    if idx >= len(images):
-        idx = 0
-        st.session_state.zoom_index = 0
-    img_dict = images[idx]
-    st.subheader(f"🔍 Viewing {folder} ({idx+1}/{len(images)})")
-    st.image(img_dict["image"], use_container_width=True)
-    col1, col2, col3 = st.columns([1, 8, 1])
-    with col1:
-        if idx > 0 and st.button("◄ Previous", key=f"prev_{folder}"):
-            st.session_state.zoom_index -= 1
-            st.rerun()
-    with col3:
-        if idx < len(images) - 1 and st.button("Next ►", key=f"next_{folder}"):
-            st.session_state.zoom_index += 1
-            st.rerun()
-    if img_dict["download"]:
-        mime = "image/jpeg" if img_dict["name"].lower().endswith(('.jpg', '.jpeg')) else "image/png"
-        st.download_button("⬇️ Download", data=img_dict["data"], file_name=img_dict["name"], mime=mime)
-    if st.session_state.is_author:
-        if st.button("🗑️ Delete Image", key=f"delete_{folder}_{img_dict['name']}"):
-            delete_image(folder, img_dict["name"])
-            st.success("Deleted.")
-            st.session_state.zoom_index = max(0, idx - 1)
-            if len(get_images(folder)) == 0:
-                st.session_state.zoom_folder = None
-                st.session_state.zoom_index = 0
-            st.rerun()
-    if st.button("⬅️ Back to Grid", key=f"back_{folder}"):
-        st.session_state.zoom_folder = None
-        st.session_state.zoom_index = 0
-        st.rerun()
+    zoom_view(st.session_state.zoom_folder)